@@ -17,147 +17,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import itertools
-import re
 from loguru import logger
 
-
-class BooleanFormulaBuilder:
-    """Builds a logic formula for a variable of Boolean network encoded in .aeon format."""
-
-    def __init__(self):
-        """Init.
-
-        reactant reflects the species that are required for formation
-        modifier reflects the state of the modifiers
-        previous is a function for other transitions
-        """
-
-        self.modifier = ""
-        self.reactant = ""
-        self.previous = ""
-
-    def function(self):
-        """Return self.previous."""
-
-        return self.previous
-
-    def add_activator(self, variable_id):
-        """Update transition to add an activator.
-
-        A reaction may only take place if all reactants/activators are present.
-        """
-
-        if self.reactant == "":
-            self.reactant = variable_id
-        else:
-            self.reactant = "({current} & {vid})".format(
-                vid=variable_id, current=self.reactant
-            )
-
-    def add_inhibitor(self, vid):
-        """If any inhibitor is active, the reaction is stopped."""
-
-        if self.reactant == "":
-            self.reactant = "!" + vid
-        else:
-            self.reactant = "(!{vid} & {current})".format(
-                vid=vid, current=self.reactant
-            )
-
-    def add_transition(self):
-        """AddTransition."""
-        self.reactant = ""
-
-    def add_catalysis(self, catalyst_list):
-        """All non-reactants, non-inhibitors in casq are treated as catalysts.
-
-        not used now (maybe for future use)
-        """
-
-        if len(catalyst_list) == 0:
-            raise RuntimeError("Empty list of catalyzers.")
-
-        base = ""
-        for vid in catalyst_list:
-            if base == "":
-                base = vid
-            else:
-                base = "({vid} | {base})".format(vid=vid, base=base)
-
-        if self.modifier == "":
-            self.modifier = base
-        else:
-            self.modifier = "({base} & {current})".format(
-                base=base, current=self.modifier)
-
-    def add_unknown_function(self, catalyst_list, target, transition_id):
-        """All non-reactants, non-inhibitors in casq are treated as catalysts.
-
-        create unknown function of catalysts and add it to logic formula
-        """
-
-        if len(catalyst_list) == 0:
-            raise RuntimeError("Empty list of catalyzers.")
-
-        cat_list_str = ""
-        for cat in catalyst_list:
-            if cat_list_str == "":
-                cat_list_str = cat
-            else:
-                cat_list_str = "{cat_list_str}, {cat}".format(cat=cat, cat_list_str=cat_list_str)
-
-        function_name = "cat_{target}_{tran_id}".format(target=target, tran_id=transition_id)
-        unknown_fun_str = "{fun_name}({cat_list_str})".format(fun_name=function_name, cat_list_str=cat_list_str)
-
-        if self.modifier == "":
-            self.modifier = unknown_fun_str
-        else:
-            self.modifier = "({current} & {unknown_fun_str})".format(
-                current=self.modifier, unknown_fun_str=unknown_fun_str
-            )
-
-    def add_and(self, catalyst_list):
-        """All listed elements are required for firing.
-
-        (maybe for future for AND_GATE)
-        """
-
-        if len(catalyst_list) == 0:
-            raise RuntimeError("Empty list of required elements.")
-
-        base = ""
-        for vid in catalyst_list:
-            if base == "":
-                base = vid
-            else:
-                base = "({vid} & {base})".format(vid=vid, base=base)
-        if self.modifier == "":
-            self.modifier = base
-        else:
-            self.modifier = "({base} & {current})".format(
-                base=base, current=self.modifier
-            )
-
-    def finish_transition(self):
-        """Add a single transition formula to the current state.
-
-        The final formula is logic alternative for all reactions for variable.
-        """
-
-        if self.modifier == "":
-            function = self.reactant
-        elif self.reactant == "":
-            function = self.modifier
-        else:
-            function = "({transition} & {current})".format(
-                transition=self.reactant, current=self.modifier)
-
-        if self.previous == "":
-            self.previous = function
-        else:
-            self.previous = "({f} | {old})".format(f=function, old=self.previous)
-        self.reactant = ""
-        self.modifier = ""
+from .logic import AND_GATE, model_logic, to_aeon, without
+from .names import aeon_name
+from .utils import open_file
 
 
 def aeon_relationship(source, target, relationship_type_str):
@@ -187,151 +51,104 @@ def aeon_relationship(source, target, relationship_type_str):
 def add_relationship(relationships, relationship):
     """Add unique relationship, fuse relationships with identity in pairs "from" and "to" variables.
 
+    relationships maps (from, to) pairs to relationships, in insertion order
     returns updated dictionary with relationships
     solve non-essential reactions and monotonicity"""
 
-    rel_dic = relationships
+    key = (relationship["from_variable"], relationship["to_variable"])
+    item = relationships.get(key)
 
-    for item in rel_dic:
-        if (item["from_variable"] == relationship["from_variable"] and
-                item["to_variable"] == relationship["to_variable"]):
+    if item is None:
+        relationships[key] = relationship
 
-            if (item["type"] != relationship["type"] or
-                    item["unknown"] != relationship["unknown"]):
-
-                if item["unknown"] and relationship["unknown"]:
-                    item["unknown"] = True
-                else:
-                    item["unknown"] = False
+    elif (item["type"] != relationship["type"] or
+            item["unknown"] != relationship["unknown"]):
 
-                #  monotonicity
-                if (item["type"] != relationship["type"] or
-                        relationship["type"] == "non_monotonic"):
-                    item["type"] = "non_monotonic"
+        if item["unknown"] and relationship["unknown"]:
+            item["unknown"] = True
+        else:
+            item["unknown"] = False
 
-            return rel_dic
+        #  monotonicity
+        if (item["type"] != relationship["type"] or
+                relationship["type"] == "non_monotonic"):
+            item["type"] = "non_monotonic"
 
-    rel_dic.append(relationship)
-    return rel_dic
+    return relationships
 
 
-def get_relationships(info, id_map, count, ignore_self_loops):
+def get_relationships(info, id_map, count, ignore_self_loops, logic):
     """Return all AEON relationships.
 
-    for every variable in model gives formula and relationships"""
+    for every variable in model gives formula, from logic, and relationships"""
 
-    transition_id = itertools.count()
+    catalysis_id = itertools.count()
     variables = {}
 
     for item_vid in info.keys():
 
-        product_name = info[item_vid]['clean_name']
-        relationships = []
-        formula = BooleanFormulaBuilder()
+        product_name = info[item_vid].clean_name
+        relationships = {}
 
         # variables may be missing from the "simplified" model.
         # test for variable in the ID map before appending
-        for transition in info[item_vid]["transitions"]:
-            tran_id = next(transition_id)
-
-            formula.add_transition()
-            logger.debug(item_vid + "\tReactants:\t" + str(transition[1]))
+        for transition in info[item_vid].transitions:
+            logger.debug(item_vid + "\tReactants:\t" + str(transition.reactants))
 
             # reactants
-            for reactant_vid in transition[1]:
+            for reactant_vid in transition.reactants:
                 if ignore_self_loops and reactant_vid == item_vid:
                     continue
                 if reactant_vid in id_map:
-                    reactant_name = info[reactant_vid]["clean_name"]
-
-                    if transition.type in (
-                        "INHIBITION",
-                        "NEGATIVE_INFLUENCE",
-                        "UNKNOWN_INHIBITION",
-                    ):
-                        formula.add_inhibitor(reactant_name)
-                    else:
-                        formula.add_activator(reactant_name)
-
+                    reactant_name = info[reactant_vid].clean_name
                     relationship = aeon_relationship(reactant_name, product_name, transition.type)
                     relationships = add_relationship(relationships, relationship)
 
-            # modifiers
-            if len(transition[2]) == 0:
-                formula.finish_transition()
-                continue
-            modifiers = transition[2]
-
-            catalysts = []
-            catalysts_names = []
-
-            for impact, modifier_vid in modifiers:
-                if ignore_self_loops and modifier_vid == item_vid:
-                    continue
-
-                if modifier_vid in id_map:
-                    modifier_name = info[modifier_vid]["clean_name"]
-
-                    if impact == "UNKNOWN_INHIBITION" or impact == "INHIBITION":
-                        formula.add_inhibitor(modifier_name)
-
-                    else:
-                        # treat all other modifiers as catalysts (casq approach)
-                        logger.debug(item_vid + "\tFound impact:" + impact)
-                        catalysts.append(id_map[modifier_vid])
-                        catalysts_names.append(modifier_name)
-
-                    relationship = aeon_relationship(modifier_name, product_name, impact)
-                    relationships = add_relationship(relationships, relationship)
-
-            logger.debug(item_vid + "\tCatalysts\t" + str(catalysts))
-
-            if len(catalysts) > 0:
-                formula.add_unknown_function(catalysts_names, product_name, tran_id)
-
-            formula.finish_transition()
+            # modifiers, all the listed elements of an AND gate are required
+            for impact, modifier in transition.modifiers:
+                if impact == AND_GATE:
+                    modifier_vids = modifier.split(",")
+                else:
+                    modifier_vids = [modifier]
+                for modifier_vid in modifier_vids:
+                    if ignore_self_loops and modifier_vid == item_vid:
+                        continue
+                    if modifier_vid in id_map:
+                        modifier_name = info[modifier_vid].clean_name
+                        relationship = aeon_relationship(modifier_name, product_name, impact)
+                        relationships = add_relationship(relationships, relationship)
+
+        function = logic.get(item_vid)
+        if ignore_self_loops and function is not None:
+            function = without(function, item_vid)
+
+        if function is None:
+            formula = ""
+        else:
+            def unknown_function(catalysts_names, target=product_name):
+                """Create unknown function of catalysts (casq approach)."""
+                return "cat_{target}_{tran_id}({cat_list_str})".format(
+                    target=target, tran_id=next(catalysis_id), cat_list_str=", ".join(catalysts_names))
 
-        formula_prev = formula.function()
+            formula = to_aeon(function, lambda vid: info[vid].clean_name, unknown_function)
 
-        variables[item_vid] = {'Formula': formula_prev, 'Relationships': relationships}
+        variables[item_vid] = {'Formula': formula, 'Relationships': list(relationships.values())}
 
     return variables
 
 
-def translate_greek(name):
-    """Translate Greek to Latin alphabet."""
-
-    greek_alphabet = "ΑαΒβΓγΔδΕεΖζΗηΘθΙιΚκΛλΜμΝνΞξΟοΠπΡρΣσςΤτΥυΦφΧχΨψΩω"
-    latin_alphabet = "AaBbGgDdEeZzHhJjIiKkLlMmNnXxOoPpRrSssTtUuFfQqYyWw"
-    greek2latin = str.maketrans(greek_alphabet, latin_alphabet)
-    return name.translate(greek2latin)
-
-
-def clean_name(name):
-    """Remove unsupported symbols (in AEON) from variables names."""
-
-    result = translate_greek(name)
-    # non-alphanumeric characters (and "\_")
-    result = re.sub('[^0-9a-zA-Z_]', '_', result)
-    return result
-
-
 def aeon_model_variable(var, var_dic, info):
-    """Return AEON model variable as a string position, logic formula and relationships to variable."""
+    """Yield the lines of AEON model variable: position, logic formula and relationships to variable."""
+
+    yield "#position:{name}:{position_x},{position_y}\n".format(name=(info[var].clean_name),
+                                                               position_x=float(info[var].x),
+                                                               position_y=float(info[var].y))
 
-    position_line = "#position:{name}:{position_x},{position_y}\n".format(name=(info[var]['clean_name']),
-                                                                          position_x=float(info[var]["x"]),
-                                                                          position_y=float(info[var]["y"]))
-    
     # If there are no transitions or the function is empty, this variable is an "input"
     # and has an empty update function.
     formula = var_dic['Formula']
     if formula != "":
-        formula_line = "${name}:{formula}\n".format(name=info[var]['clean_name'], formula=formula)
-    else:
-        formula_line = ""
-
-    relationships_lines = ""
+        yield "${name}:{formula}\n".format(name=info[var].clean_name, formula=formula)
 
     for relationship in var_dic['Relationships']:
         reaction_type = "-"
@@ -345,16 +162,11 @@ def aeon_model_variable(var, var_dic, info):
         if relationship['unknown']:
             reaction_type += "?"
 
-        relationship_str = "{from_v} {type} {to_v}\n".format(
-            type_str=relationship['type_str'],
+        yield "{from_v} {type} {to_v}\n".format(
             from_v=relationship['from_variable'],
             type=reaction_type,
             to_v=relationship['to_variable'])
 
-        relationships_lines += relationship_str
-
-    return position_line + formula_line + relationships_lines
-
 
 def clean_names(info):
     """Clean all names of variables in info.
@@ -364,27 +176,30 @@ def clean_names(info):
     clean_names_dic = {}
 
     for vid in info.keys():
-        name = info[vid]['name']
-        c_name = clean_name(name)
+        name = info[vid].name
+        c_name = aeon_name(name)
 
         if c_name not in clean_names_dic.keys():
             clean_names_dic[c_name] = {name: c_name}
-            info[vid]['clean_name'] = c_name
+            info[vid].clean_name = c_name
 
         else:  # c_name in
             if name in clean_names_dic[c_name]:
-                info[vid]['clean_name'] = clean_names_dic[c_name][name]
+                info[vid].clean_name = clean_names_dic[c_name][name]
             else:
                 clean_names_dic[c_name][name] = c_name + "_v" + str(len(clean_names_dic[c_name]) + 1)
-                info[vid]['clean_name'] = clean_names_dic[c_name][name]
+                info[vid].clean_name = clean_names_dic[c_name][name]
 
 
 def write_aeon(
     file_name: str,
     info,
     ignore_self_loops=False,
+    logic=None,
 ):
-    """Write the .aeon file for our model."""
+    """Write the .aeon file for our model.
+
+    logic defaults to the model_logic of info."""
 
     id_generator = itertools.count(1)
     id_map = {k: next(id_generator) for k in info.keys()}
@@ -392,20 +207,26 @@ def write_aeon(
     # add clean names of variables into info
     clean_names(info)
 
+    if logic is None:
+        logic = model_logic(info)
     relationships_dic = get_relationships(
-        info, id_map, id_generator, ignore_self_loops
+        info, id_map, id_generator, ignore_self_loops, logic
     )
 
-    model_variables_str = [
-        aeon_model_variable(variable, relationships_dic[variable], info)
-        for variable in relationships_dic.keys()
-    ]
+    if isinstance(file_name, str):
+        with open_file(file_name, "w") as outfile:
+            write_variables(outfile, relationships_dic, info)
+    else:
+        write_variables(file_name, relationships_dic, info)
+
+
+def write_variables(outfile, relationships_dic, info):
+    """Write the lines of all variables as they are produced."""
 
     name = "#name:\n"
     description = "#description:\n"
 
-    with open(file_name, "w", encoding='utf-8') as outfile:
-        # outfile.write(name)
-        # outfile.write(description)
-        for var in model_variables_str:
-            outfile.write(var)
+    # outfile.write(name)
+    # outfile.write(description)
+    for variable, var_dic in relationships_dic.items():
+        outfile.writelines(aeon_model_variable(variable, var_dic, info))
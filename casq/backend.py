@@ -0,0 +1,99 @@
+"""XML backend, using lxml when it is installed and the standard library otherwise.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import xml.etree.ElementTree as ElementTree
+from typing import IO, Dict, Optional
+
+try:
+    from lxml import etree  # type: ignore
+
+    LXML = True
+except ImportError:  # pragma: no cover
+    etree = ElementTree
+    LXML = False
+
+
+class Path:
+    """A fixed path query, compiled once for the current backend.
+
+    The path must be valid both as ElementPath and as XPath.
+    """
+
+    def __init__(self, path: str, namespaces: Dict[str, str]):
+        """Init."""
+        self.path = path
+        self.namespaces = namespaces
+        if LXML:
+            self.xpath = etree.XPath(path, namespaces=namespaces)
+
+    def find(self, elem):
+        """Return the first matching sub-element, or None."""
+        if LXML:
+            result = self.xpath(elem)
+            if result:
+                return result[0]
+            return None
+        return elem.find(self.path, self.namespaces)
+
+    def findall(self, elem):
+        """Return all matching sub-elements in document order."""
+        if LXML:
+            return self.xpath(elem)
+        return elem.findall(self.path, self.namespaces)
+
+
+class _Encoded:
+    """Bytes view of a text file object without an underlying buffer."""
+
+    def __init__(self, fileobj: IO):
+        self.fileobj = fileobj
+
+    def read(self, size: int = -1) -> bytes:
+        return self.fileobj.read(size).encode("utf-8")
+
+
+def _binary(fileobj: IO):
+    """Give lxml the bytes it requires, letting it decode the document itself."""
+    if not LXML or isinstance(fileobj.read(0), bytes):
+        return fileobj
+    if hasattr(fileobj, "buffer"):
+        return fileobj.buffer
+    return _Encoded(fileobj)
+
+
+def parse(fileobj: IO):
+    """Parse a whole XML document and return its root element."""
+    return etree.parse(_binary(fileobj)).getroot()
+
+
+def iterparse(fileobj: IO, events=("start", "end")):
+    """Incrementally parse an XML document."""
+    return etree.iterparse(_binary(fileobj), events=events)
+
+
+def native(elem: Optional[ElementTree.Element]) -> Optional[ElementTree.Element]:
+    """Return a standard library copy of elem, tail included.
+
+    Sub-trees kept from the input end up inside the SBML-qual document, which
+    is always serialized by the standard library to keep a stable output.
+    """
+    if not LXML or elem is None:
+        return elem
+    copy = ElementTree.fromstring(etree.tostring(elem, with_tail=False))
+    copy.tail = elem.tail
+    return copy
@@ -0,0 +1,192 @@
+"""Convert many CellDesigner models in parallel.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from loguru import logger  # type: ignore
+
+from .celldesigner2qual import format_files, output_formats, write_model
+from .logic import model_logic
+from .readCD import read_celldesigner
+from .simplify import simplify_model
+from .utils import open_file, split_compression
+
+
+def is_map(filename: str) -> bool:
+    """Check if filename looks like a possibly compressed CellDesigner file."""
+    base, _ = split_compression(filename)
+    return base.lower().endswith(".xml") and os.path.isfile(filename)
+
+
+def collect_inputs(paths: List[str]) -> List[str]:
+    """Expand directories and globs into the list of maps to convert.
+
+    Directories give all the (possibly compressed) XML files they contain,
+    globs all matching files, and other paths are kept as they are.
+    """
+    inputs = {}  # type: Dict[str, None]
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                filename = os.path.join(path, name)
+                if is_map(filename):
+                    inputs[filename] = None
+        elif glob.has_magic(path):
+            for filename in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(filename):
+                    inputs[filename] = None
+        else:
+            inputs[path] = None
+    return list(inputs)
+
+
+def written_files(formats: List[str], outfiles: Dict[str, str]) -> List[str]:
+    """Return all files written for outfiles, with the SIF and CSV ones."""
+    written = list(outfiles.values())
+    if "sbml" in outfiles:
+        base, ext = split_compression(outfiles["sbml"])
+        if "sif" in formats:
+            written += [base[:-4] + "sif" + ext, base[:-5] + "_raw.sif" + ext]
+        if "csv" in formats:
+            written += [base[:-4] + "csv" + ext, base[:-4] + "bnet" + ext]
+    return written
+
+
+def up_to_date(infile: str, outfiles: List[str]) -> bool:
+    """Check if all outputs exist and are newer than infile."""
+    try:
+        mtime = os.path.getmtime(infile)
+        return all(os.path.getmtime(outfile) >= mtime for outfile in outfiles)
+    except OSError:
+        return False
+
+
+def convert(infile: str, outfiles: Dict[str, str], options) -> float:
+    """Convert a single map to all outfiles, returning the time it took."""
+    start = time.perf_counter()
+    if not options.debug:
+        logger.disable("casq")
+    try:
+        with open_file(infile) as f:
+            info, width, height = read_celldesigner(f)
+        simplify_model(info, [], [])
+        logic = model_logic(info)
+        for fmt, outfile in outfiles.items():
+            write_model(fmt, outfile, info, width, height, options, logic)
+    except Exception as e:  # pylint: disable=broad-except
+        # some exceptions, like those of lxml, cannot be sent back by the worker
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return time.perf_counter() - start
+
+
+def main(argv: List[str]) -> int:
+    """Run batch conversion using the CLI given arguments."""
+    parser = argparse.ArgumentParser(
+        prog="casq batch",
+        description="Convert all CellDesigner models in directories or globs.",
+    )
+    parser.add_argument(
+        "-D", "--debug", action="store_true", help="Display a lot of debug information"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of maps converted at the same time (defaults to the number of CPUs)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        metavar="DIR",
+        help="Write all outputs to DIR instead of next to their input",
+    )
+    parser.add_argument(
+        "--formats",
+        metavar="F,...",
+        type=output_formats,
+        default=["sbml"],
+        help="Formats to write, among sbml, bma, aeon, sif and csv (defaults to sbml)",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="When exporting to BMA, write json without indentation",
+    )
+    parser.add_argument(
+        "-F",
+        "--force",
+        action="store_true",
+        help="Convert maps even if their outputs are newer",
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="CellDesigner files, directories or globs"
+    )
+    args = parser.parse_args(argv)
+    if not args.debug:
+        logger.disable("casq")
+    # the same defaults as a single conversion
+    options = argparse.Namespace(
+        debug=args.debug,
+        granularity=1,
+        input=None,
+        colourConstant=True,
+        compact=args.compact,
+        remove=0,
+        sif="sif" in args.formats,
+        csv="csv" in args.formats,
+        fixed=None,
+    )
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    jobs = {}
+    skipped = 0
+    for infile in collect_inputs(args.paths):
+        base = infile
+        if args.output_dir:
+            base = os.path.join(args.output_dir, os.path.basename(infile))
+        outfiles = format_files(args.formats, base)
+        if not args.force and up_to_date(infile, written_files(args.formats, outfiles)):
+            logger.debug("{fname} is up to date", fname=infile)
+            skipped += 1
+        else:
+            jobs[infile] = outfiles
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {
+            infile: executor.submit(convert, infile, outfiles, options)
+            for infile, outfiles in jobs.items()
+        }
+        for infile, future in futures.items():
+            try:
+                print(f"{future.result():8.2f}s  {infile}")
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"  FAILED  {infile}: {e}", file=sys.stderr)
+                failed += 1
+    print(
+        f"{len(jobs) - failed} converted, {skipped} up to date, {failed} failed",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
@@ -18,126 +18,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import itertools
 import json
+from typing import Callable, Iterator, Optional
 
 from loguru import logger
 
-
-class booleanFormulaBuilder:
-    """Builds a formula for a boolean network encoded in BMA.
-
-    The formula is a max applied to a series of reactions (transitions),
-    so that if at least one reaction is active the variable becomes active
-    """
-
-    def __init__(self):
-        """Init.
-
-        reactant reflects the species that are required for formation
-        modifier reflects the state of the modifiers
-        previous is a function for other transitions
-        """
-        self.modifier = "1"
-        self.reactant = "1"
-        self.previous = "0"
-
-    def function(self):
-        """Return self.previous."""
-        return self.previous
-
-    def addActivator(self, vid):
-        """Update transition to add an activator.
-
-        A reaction may only take place if all reactants/activators are present.
-        """
-        self.reactant = "(min(var({vid}),{current}))".format(
-            vid=vid, current=self.reactant
-        )
-
-    def addInhibitor(self, vid):
-        """If any inhibitor is active, the reaction is stopped."""
-        self.reactant = "(min(1-var({vid}),{current}))".format(
-            vid=vid, current=self.reactant
-        )
-
-    def addTransition(self):
-        """AddTransition."""
-        self.reactant = "1"
-
-    def addCatalysis(self, vidList):
-        """All non-reactants, non-inhibitors in casq are treated as catalysts.
-
-        If at least one catalyst is active, the reaction can proceed.
-        This is achieved in BMA with a min function
-        """
-        base = "0"
-        for vid in vidList:
-            base = "(max(var({vid}),{base}))".format(vid=vid, base=base)
-        self.modifier = "(min({base},{current}))".format(
-            base=base, current=self.modifier
-        )
-
-    def addAnd(self, vidList):
-        """All listed elements are required for firing."""
-        base = "1"
-        for vid in vidList:
-            base = "(min(var({vid}),{base}))".format(vid=vid, base=base)
-        self.modifier = "(min({base},{current}))".format(
-            base=base, current=self.modifier
-        )
-
-    def finishTransition(self):
-        """Add a single transition formula to the current state.
-
-        The final formula is the min of the transition and the catalyst-modifiers
-        The catalyst-modifiers default to 1, the transition defaults to 1
-        Resets the transition formula to 1.
-        """
-        function = "(min({transition},{current}))".format(
-            transition=self.reactant, current=self.modifier
-        )
-        self.previous = "(max({f},{old}))".format(f=function, old=self.previous)
-        self.reactant = "1"
-        self.modifier = "1"
-
-
-class multiStateFormulaBuilder:
-    """Builds a multistate formula.
-
-    This is more simple as BMA defaults to avg(pos)-avg(neg).
-    """
-
-    def __init__(self):
-        """Init."""
-        self.value = ""
-
-    def function(self):
-        """Return self.value."""
-        return self.value
-
-    def addActivator(self, vid):
-        """Do nothing."""
-        pass
-
-    def addInhibitor(self, vid):
-        """Do nothing."""
-        pass
-
-    def addAnd(self, vid):
-        """Do nothing."""
-        pass
-
-    def addCatalysis(self, vidList):
-        """Do nothing."""
-        pass
-
-    def addTransition(self):
-        """Do nothing."""
-        pass
-
-    def finishTransition(self):
-        """Do nothing."""
-        pass
-
+from .logic import AND_GATE, INHIBITION, NEGATIVE, model_logic, to_bma, without
+from .names import bma_name
+from .utils import open_file
 
 # hardcoded colour codes so elements still follow BMA colourscheme
 # Default pink #ff66cc
@@ -155,124 +42,65 @@ def bma_relationship(source, target, idMap, count, which="Activator"):
     return result
 
 
-def get_relationships(info, idMap, count, granularity, ignoreSelfLoops):
-    """Return all BMA relationships."""
+def get_relationships(info, idMap, count, granularity, ignoreSelfLoops, logic):
+    """Return all BMA relationships, and formulae from the functions in logic."""
     relationships = []
     allFormulae = {}
     for item in info.keys():
         logger.debug(
-            item + ", varid = " + str(idMap[item]) + ", name = " + info[item]["name"]
+            item + ", varid = " + str(idMap[item]) + ", name = " + info[item].name
         )
         # skip if there are no transitions
-        if len(info[item]["transitions"]) == 0:
+        if len(info[item].transitions) == 0:
             logger.debug(item + "-No transitions")
             continue
         product = item
-        if granularity == 1:
-            formula = booleanFormulaBuilder()
-        else:
-            formula = multiStateFormulaBuilder()
+        # species are often both reactants, AND gate members and catalysts
+        related = set()
         # variables may be missing from the "simplified" model.
         # Test for variable in the ID map before appending
-        for transition in info[item]["transitions"]:
-            formula.addTransition()
-            logger.debug(item + "\tReactants:\t" + str(transition[1]))
-            # reactant
-            for reactant in transition[1]:
+        for transition in info[item].transitions:
+            logger.debug(item + "\tReactants:\t" + str(transition.reactants))
+            if transition.type in NEGATIVE:
+                which = "Inhibitor"
+            else:
+                which = "Activator"
+            for reactant in transition.reactants:
                 if ignoreSelfLoops and reactant == product:
                     continue
-                if reactant in idMap:
-                    if transition.type in (
-                        "INHIBITION",
-                        "NEGATIVE_INFLUENCE",
-                        "UNKNOWN_INHIBITION",
-                    ):
-                        relationships.append(
-                            bma_relationship(
-                                reactant, product, idMap, count, "Inhibitor"
-                            )
-                        )
-                        formula.addInhibitor(idMap[reactant])
-                    else:
-                        relationships.append(
-                            bma_relationship(reactant, product, idMap, count)
-                        )
-                        formula.addActivator(idMap[reactant])
+                if reactant in idMap and (reactant, which) not in related:
+                    related.add((reactant, which))
+                    relationships.append(
+                        bma_relationship(reactant, product, idMap, count, which)
+                    )
+            logger.debug(str(transition.modifiers))
+            for impact, m in transition.modifiers:
+                if impact in INHIBITION:
+                    which = "Inhibitor"
                 else:
-                    pass
-            # now modifiers
-            if len(transition[2]) == 0:
-                formula.finishTransition()
-                continue
-            modifiers = transition[2]
-            # catalysts are a special case
-            catalysts = []
-            inhibitors = []
-            # List of variables that should be omitted from formulae due to other function
-            ignoreList = []
-            # everything else
-            logger.debug(str(modifiers))
-            for impact, m in modifiers:
-                if ignoreSelfLoops and m == product:
-                    continue
-                if impact == "BOOLEAN_LOGIC_GATE_AND":
-                    logger.debug("Found an AND gate")
-                    # indicates that the listed vars will be anded
-                    # BAH: should I remove them from the cat code? In this instance its harmless...
-                    vidList = [idMap[jtem] for jtem in m.split(",") if jtem in idMap]
-                    formula.addAnd(vidList)
-                    for jtem in vidList:
-                        ignoreList.append(jtem)
-                if m in idMap:
-                    if impact == "UNKNOWN_INHIBITION" or impact == "INHIBITION":
+                    which = "Activator"
+                # the listed vars of an AND gate are all required
+                for jtem in m.split(",") if impact == AND_GATE else (m,):
+                    if ignoreSelfLoops and jtem == product:
+                        continue
+                    if jtem in idMap and (jtem, which) not in related:
+                        related.add((jtem, which))
                         relationships.append(
-                            bma_relationship(m, product, idMap, count, "Inhibitor")
+                            bma_relationship(jtem, product, idMap, count, which)
                         )
-
-                        formula.addInhibitor(idMap[m])
-                        inhibitors.append(idMap[m])
-                    else:
-                        # treat all other modifiers as catalysts (casq approach)
-                        logger.debug(item + "\tFound impact:" + impact)
-                        catalysts.append(idMap[m])
-                        relationships.append(bma_relationship(m, product, idMap, count))
-                else:
-                    pass
-            logger.debug(item + "\tCatalysts\t" + str(catalysts))
-            logger.debug(item + "\tInhibitors\t" + str(inhibitors))
-            logger.debug(item + "\tIgnoreList\t" + str(ignoreList))
-            # filter catalysts for items to be ignored
-            finalCat = [item for item in catalysts if item not in ignoreList]
-            if len(finalCat) > 0:
-                formula.addCatalysis(finalCat)
-            formula.finishTransition()
-        allFormulae[item] = formula.function()
+        if granularity > 1:
+            # BMA defaults to avg(pos)-avg(neg) for multistate variables
+            allFormulae[item] = ""
+            continue
+        function = logic.get(item)
+        if ignoreSelfLoops and function is not None:
+            function = without(function, product)
+        # without any known input, this is an input variable
+        if function is not None:
+            allFormulae[item] = to_bma(function, idMap.__getitem__)
     return (relationships, allFormulae)
 
 
-def translateGreek(name):
-    """Translate Greek to Latin alphabet."""
-    greek_alphabet = "ΑαΒβΓγΔδΕεΖζΗηΘθΙιΚκΛλΜμΝνΞξΟοΠπΡρΣσςΤτΥυΦφΧχΨψΩω"
-    latin_alphabet = "AaBbGgDdEeZzHhJjIiKkLlMmNnXxOoPpRrSssTtUuFfQqYyWw"
-    greek2latin = str.maketrans(greek_alphabet, latin_alphabet)
-    return name.translate(greek2latin)
-
-
-def depunctuate(name):
-    """Replace punctuation by underscores."""
-    badChars = " ,-()+:/\\'[]><"
-    alternatives = "______________"
-    cleanup = str.maketrans(badChars, alternatives)
-    return name.translate(cleanup)
-
-
-def cleanName(name):
-    """Remove punctuation and replace Greek letters."""
-    noPunctuation = depunctuate(name)
-    result = translateGreek(noPunctuation)
-    return result
-
-
 def bma_model_variable(vid, infoVariable, formulaDict, v, granularity, inputLevel):
     """Return BMA model variable as a dict."""
     if v in formulaDict:
@@ -284,7 +112,7 @@ def bma_model_variable(vid, infoVariable, formulaDict, v, granularity, inputLeve
         else:
             formula = str(inputLevel)
     result = {
-        "Name": cleanName(infoVariable["name"]),
+        "Name": bma_name(infoVariable.name),
         "Id": vid,
         "RangeFrom": 0,
         "RangeTo": granularity,
@@ -297,11 +125,11 @@ def bma_layout_variable(vid, infoVariable, fill=None, description=""):
     """Return BMA layout variable as a dict."""
     result = {
         "Id": vid,
-        "Name": cleanName(infoVariable["name"]),
+        "Name": bma_name(infoVariable.name),
         "Type": "Constant",
         "ContainerId": 0,
-        "PositionX": float(infoVariable["x"]),
-        "PositionY": float(infoVariable["y"]),
+        "PositionX": float(infoVariable.x),
+        "PositionY": float(infoVariable.y),
         "CellY": 0,
         "CellX": 0,
         "Angle": 0,
@@ -319,16 +147,22 @@ def write_bma(
     inputLevel=None,
     ignoreSelfLoops=False,
     colourByCompartment=True,
+    compact=False,
+    logic=None,
 ):
     # pylint: disable=too-many-arguments, too-many-locals
-    """Write the BMA json with layout file for our model."""
+    """Write the BMA json with layout file for our model.
+
+    The file is written while it is generated, without indentation if compact.
+    logic defaults to the model_logic of info.
+    """
     # granularity must be a non-zero natural
     assert granularity > 0
     # calculate the compartments for colours;
     # four largest compartments are coloured BMA colours, all else default
     compartments = {}
     for k in info.keys():
-        location = info[k]["compartment"]
+        location = info[k].compartment
         if location in compartments:
             compartments[location] += 1
         else:
@@ -345,31 +179,75 @@ def write_bma(
     idGenerator = itertools.count(1)
     idMap = {k: next(idGenerator) for k in info.keys()}
 
+    if logic is None:
+        logic = model_logic(info)
     rm, formula = get_relationships(
-        info, idMap, idGenerator, granularity, ignoreSelfLoops
+        info, idMap, idGenerator, granularity, ignoreSelfLoops, logic
     )
 
     logger.debug(formula)
 
-    vm = [
+    # variables are only created while they are written
+    vm = (
         bma_model_variable(idMap[v], info[v], formula, v, granularity, inputLevel)
         for v in info.keys()
-    ]
-    vl = [
+    )
+    vl = (
         bma_layout_variable(
             idMap[v],
             info[v],
-            compartmentColour[info[v]["compartment"]],
-            info[v]["compartment"],
+            compartmentColour[info[v].compartment],
+            info[v].compartment,
         )
         for v in info.keys()
-    ]
+    )
 
-    model = {"Name": "CaSQ-BMA", "Variables": vm, "Relationships": rm}
+    model = {"Name": "CaSQ-BMA", "Variables": vm, "Relationships": iter(rm)}
     layout = {"Variables": vl, "Containers": [], "Description": ""}
     ltl = {"states": [], "operations": []}
     universe = {"Model": model, "Layout": layout, "ltl": ltl}
 
-    json_object = json.dumps(universe, indent=4)
-    with open(filename, "w") as outfile:
-        outfile.write(json_object)
+    indent = None if compact else 4
+    if isinstance(filename, str):
+        with open_file(filename, "w") as outfile:
+            dump_json(outfile.write, universe, indent)
+    else:
+        dump_json(filename.write, universe, indent)
+
+
+def dump_json(
+    write: Callable[[str], object], obj, indent: Optional[int] = None, level: int = 0
+):
+    """Write obj like json.dumps, without building the whole string.
+
+    Iterators are written as lists, one item at a time. Without indent the
+    separators are as compact as possible.
+    """
+    if isinstance(obj, dict):
+        key_separator = ": " if indent is not None else ":"
+        items = ((json.dumps(key) + key_separator, value) for key, value in obj.items())
+        opening, closing = "{", "}"
+    elif isinstance(obj, Iterator):
+        items = (("", value) for value in obj)
+        opening, closing = "[", "]"
+    else:
+        if indent is None:
+            write(json.dumps(obj, separators=(",", ":")))
+        else:
+            text = json.dumps(obj, indent=indent)
+            write(text.replace("\n", "\n" + " " * (indent * level)))
+        return
+    if indent is None:
+        inner = outer = ""
+    else:
+        inner = "\n" + " " * (indent * (level + 1))
+        outer = "\n" + " " * (indent * level)
+    write(opening)
+    separator = inner
+    for key, value in items:
+        write(separator + key)
+        dump_json(write, value, indent, level + 1)
+        separator = "," + inner
+    if separator != inner:
+        write(outer)
+    write(closing)
@@ -0,0 +1,148 @@
+"""On-disk cache of parsed and simplified CellDesigner models.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import IO, Callable, List, Optional
+
+from loguru import logger  # type: ignore
+
+from . import version
+from .readCD import read_celldesigner
+from .simplify import simplify_model
+
+MAX_SIZE = 512 * 2**20
+SUFFIX = ".pickle"
+# entries start with this line, then the SHA-256 of the pickle that follows;
+# this catches truncated or foreign files, but the directory must still be
+# trusted since anyone able to write there can make a valid entry
+HEADER = f"casq cache {version}\n".encode("utf-8")
+
+
+def cache_key(
+    filename: str,
+    upstream: List[str],
+    downstream: List[str],
+    names_as_ids: bool,
+    max_depth: Optional[int] = None,
+) -> str:
+    """Hash the content of filename together with everything simplification uses."""
+    content = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            content.update(chunk)
+    key = hashlib.sha256()
+    for part in (
+        content.hexdigest(),
+        version,
+        repr(sorted(upstream)),
+        repr(sorted(downstream)),
+        repr(names_as_ids),
+        repr(max_depth),
+    ):
+        key.update(part.encode("utf-8"))
+        key.update(b"\0")
+    return key.hexdigest()
+
+
+def read_simplified(
+    fileobj: IO,
+    cache_dir: str,
+    upstream: List[str],
+    downstream: List[str],
+    names_as_ids: bool = False,
+    reader: Callable = read_celldesigner,
+    max_size: int = MAX_SIZE,
+    max_depth: Optional[int] = None,
+):
+    # pylint: disable=too-many-arguments
+    """Read and simplify the model in fileobj, unless it is in cache_dir already.
+
+    fileobj must be a named file, whose content is hashed to find the cache
+    entry. Returns the same (info, width, height) triple as the readers.
+    Entries are unpickled, so cache_dir must only be writable by trusted users.
+    """
+    key = cache_key(fileobj.name, upstream, downstream, names_as_ids, max_depth)
+    path = os.path.join(cache_dir, key + SUFFIX)
+    try:
+        model = load(path)
+        # the modification time is what eviction uses as last use
+        os.utime(path)
+        logger.debug("using cached model {path}", path=path)
+        return model
+    except FileNotFoundError:
+        pass
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+        os.remove(path)
+    info, width, height = reader(fileobj)
+    simplify_model(info, upstream, downstream, names_as_ids, max_depth)
+    store(cache_dir, path, (info, width, height))
+    evict(cache_dir, max_size)
+    return info, width, height
+
+
+def load(path: str):
+    """Return the model stored in path, if its header and checksum match."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        checksum = f.readline().rstrip(b"\n")
+        data = f.read()
+    if header != HEADER:
+        raise pickle.UnpicklingError("not written by this version of casq")
+    if hashlib.sha256(data).hexdigest().encode("ascii") != checksum:
+        raise pickle.UnpicklingError("checksum mismatch")
+    return pickle.loads(data)
+
+
+def store(cache_dir: str, path: str, model):
+    """Atomically write model to path, after its header and checksum."""
+    os.makedirs(cache_dir, exist_ok=True)
+    data = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER)
+            f.write(hashlib.sha256(data).hexdigest().encode("ascii") + b"\n")
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def evict(cache_dir: str, max_size: int):
+    """Remove the least recently used entries until the cache fits in max_size."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(SUFFIX) and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        logger.debug("evicting cached model {path}", path=path)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # another process evicted it first
+            pass
+        total -= size
@@ -17,22 +17,28 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import argparse
+import io
 import os.path
 import sys
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 
 from loguru import logger  # type: ignore
 
-from casq import bmaExport, aeonExport, version
-from casq.readCD import read_celldesigner
+from casq import bmaExport, aeonExport, fixpoints, screen, validator, version
+from casq.cache import MAX_SIZE, read_simplified
+from casq.logic import model_logic
+from casq.readCD import Species, Transition, read_celldesigner, stream_celldesigner
+from casq.reduce import reduce_model, write_reduction
 from casq.simplify import simplify_model
+from casq.utils import COMPRESSORS, open_file, split_compression
 from casq.write import write_csv, write_qual
 
 
 def map_to_model(map_filename: str, model_filename: str, bma=False):
     """Do the full run with defaults arguments."""
     logger.disable("casq")
-    with open(map_filename, "r", encoding="utf-8") as f:
+    with open_file(map_filename) as f:
         info, width, height = read_celldesigner(f)
     simplify_model(info, [], [])
     if not bma:
@@ -41,8 +47,180 @@ def map_to_model(map_filename: str, model_filename: str, bma=False):
         bmaExport.write_bma(model_filename, info, 1, None, False, True)
 
 
+def input_file(filename: str):
+    """Open a possibly compressed CellDesigner file, - being the standard input."""
+    if filename == "-":
+        return sys.stdin
+    try:
+        return open_file(filename)
+    except (OSError, ValueError) as e:
+        raise argparse.ArgumentTypeError(f"can't open '{filename}': {e}") from e
+
+
+def output_name(infile_name: str, suffix: str) -> str:
+    """Derive the output file name, compressed as the input file if possible."""
+    base, ext = split_compression(infile_name)
+    if ext.lower() not in COMPRESSORS:
+        ext = ""
+    return os.path.splitext(base)[0] + suffix + ext
+
+
+FORMATS = ("sbml", "bma", "aeon", "sif", "csv")
+SUFFIXES = {"sbml": ".sbml", "bma": ".bma.json", "aeon": ".aeon"}
+
+
+def output_formats(value: str) -> List[str]:
+    """Parse a comma-separated list of output formats."""
+    formats = [fmt.strip().lower() for fmt in value.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(
+            f"unknown format(s) {','.join(unknown)}, choose among {','.join(FORMATS)}"
+        )
+    return formats
+
+
+def write_model(
+    fmt: str,
+    outfile,
+    info,
+    width: str,
+    height: str,
+    args,
+    logic: Optional[Dict[str, object]] = None,
+):
+    # pylint: disable=too-many-arguments
+    """Write the simplified model in one of the sbml, bma or aeon formats.
+
+    logic is the model_logic of info, computed by the exporter if missing.
+    """
+    if fmt == "bma":
+        bmaExport.write_bma(
+            outfile,
+            info,
+            args.granularity,
+            args.input,
+            False,
+            args.colourConstant,
+            args.compact,
+            logic,
+        )
+    elif fmt == "aeon":
+        aeonExport.write_aeon(outfile, info, False, logic)
+    else:
+        write_qual(
+            outfile,
+            info,
+            width,
+            height,
+            remove=args.remove,
+            sif=args.sif,
+            fixed=args.fixed,
+            logic=logic,
+        )
+        if args.csv and outfile != sys.stdout:
+            write_csv(outfile, info)
+
+
+def without_xml(info) -> Dict[str, Species]:
+    """Return a copy of info without the notes and annotations.
+
+    Only the SBML-qual writer uses them, and they are most of what workers
+    writing the other formats would be sent.
+    """
+    light = {}
+    # transitions are shared by all products of a reaction
+    transitions = {}  # type: Dict[int, Transition]
+    for species, data in info.items():
+        light[species] = Species(**data)
+        light[species].annotations = None
+        light[species].transitions = [
+            transitions.setdefault(
+                id(trans), trans._replace(notes=None, annotations=None)
+            )
+            for trans in data.transitions
+        ]
+    return light
+
+
+def write_in_worker(fmt: str, outfile: str, model, args, logic):
+    """Write one format in its own process, with its own copy of the model."""
+    if not args.debug:
+        logger.disable("casq")
+    write_model(fmt, outfile, *model, args, logic)
+    return outfile
+
+
+def format_files(formats: List[str], base: str) -> Dict[str, str]:
+    """Return the file name for each main format, SBML-qual last.
+
+    The SIF and CSV files always come with the SBML-qual file, which is
+    written last since it removes species that other formats would keep.
+    """
+    main_formats = [fmt for fmt in ("bma", "aeon") if fmt in formats]
+    if set(formats) & {"sbml", "sif", "csv"} or not main_formats:
+        main_formats.append("sbml")
+    return {fmt: output_name(base, SUFFIXES[fmt]) for fmt in main_formats}
+
+
+def write_formats(
+    formats: List[str],
+    base: str,
+    model,
+    args,
+    logic: Optional[Dict[str, object]] = None,
+):
+    """Write all formats of a single model, concurrently.
+
+    The SIF and CSV files always come with the SBML-qual file. All formats
+    share logic, computed once if missing. The last format is written by
+    this process, the others by workers sent the model without its XML.
+    """
+    # exporters modify the model, and the workers need to pickle the arguments
+    options = argparse.Namespace(**vars(args))
+    options.infile = options.outfile = None
+    options.sif = args.sif or "sif" in formats
+    options.csv = args.csv or "csv" in formats
+    if args.fixed:
+        options.fixed = io.StringIO(args.fixed.read())
+    if options.sif or options.csv:
+        formats = formats + ["sbml"]
+    outfiles = format_files(formats, base)
+    if logic is None:
+        logic = model_logic(model[0])
+    *others, (fmt, outfile) = outfiles.items()
+    if not others:
+        write_model(fmt, outfile, *model, options, logic)
+        return
+    # no worker uses the fixed species, which may still be read here
+    worker_options = argparse.Namespace(**vars(options))
+    worker_options.fixed = None
+    light = (without_xml(model[0]),) + tuple(model[1:])
+    with ProcessPoolExecutor(max_workers=len(others)) as executor:
+        futures = [
+            executor.submit(write_in_worker, other, name, light, worker_options, logic)
+            for other, name in others
+        ]
+        write_model(fmt, outfile, *model, options, logic)
+        for future in futures:
+            logger.debug("wrote {fname}", fname=future.result())
+
+
 def main(argv: List[str] = None):
     """Run conversion using the CLI given first argument."""
+    if not argv:
+        argv = sys.argv[1:]
+    if argv[:1] == ["batch"]:
+        # batch conversion uses the functions of this module
+        from casq.batch import main as batch_main
+
+        return batch_main(argv[1:])
+    if argv[:1] == ["validate"]:
+        return validator.main(argv[1:])
+    if argv[:1] == ["fixpoints"]:
+        return fixpoints.main(argv[1:])
+    if argv[:1] == ["screen"]:
+        return screen.main(argv[1:])
     parser = argparse.ArgumentParser(
         description="""Convert CellDesigner models to SBML-qual with a rather strict semantics.
    Copyright (C) 2019, Sylvain.Soliman@inria.fr GPLv3.\n 
@@ -88,6 +266,32 @@ def main(argv: List[str] = None):
         help="""A CSV file containing input values or knock-ins/knock-outs,
         one per line, with name in the first column and the value in the second.""",
     )
+    parser.add_argument(
+        "--reduce",
+        action="store_true",
+        help="""Remove species fixed or determined by fixed ones, merge species
+        copying another one, and remove those that no phenotype needs, before
+        exporting. What became of them is stored in a separate CSV file""",
+    )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help="Read the CellDesigner file incrementally, dropping XML once parsed",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help="""Keep parsed and simplified models in DIR, keyed by the content
+        of the input file, and reuse them when converting the same file again.
+        Only use a DIR that untrusted users cannot write to""",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="MB",
+        type=int,
+        default=MAX_SIZE // 2**20,
+        help="Maximum size of the cache directory, least recently used models are removed first",
+    )
     parser.add_argument(
         "-n",
         "--names",
@@ -130,12 +334,19 @@ def main(argv: List[str] = None):
             default=[],
             help="Only species downstream of this/these species will be kept",
         )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=None,
+        metavar="K",
+        help="With --upstream/--downstream, only keep species at most K steps away",
+    )
     parser.add_argument(
         "infile",
-        type=argparse.FileType("r", encoding="utf-8"),
+        type=input_file,
         nargs="?",
         default=sys.stdin,
-        help="CellDesigner File",
+        help="CellDesigner File, possibly compressed (.gz, .bz2, .xz or .zip)",
     )
     parser.add_argument(
         "-a",
@@ -170,46 +381,94 @@ def main(argv: List[str] = None):
         help="When exporting to BMA, colour all variables pink (defaults to colour by compartment)",
     )
     parser.add_argument(
-        "outfile", nargs="?", default=sys.stdout, help="SBML-Qual/BMA json File/.aeon File"
+        "--compact",
+        action="store_true",
+        help="When exporting to BMA, write json without indentation",
+    )
+    parser.add_argument(
+        "--formats",
+        metavar="F,...",
+        type=output_formats,
+        help="""Write several formats among sbml, bma, aeon, sif and csv at once,
+        concurrently, from a single parse. Their names are derived from outfile,
+        or else from infile. The -a, -b, -s and -c options add to them""",
+    )
+    parser.add_argument(
+        "outfile",
+        nargs="?",
+        default=sys.stdout,
+        help="SBML-Qual/BMA json File/.aeon File, compressed if ending in .gz, .bz2 or .xz",
     )
     if argv:
         args = parser.parse_args(argv)
     else:
         args = parser.parse_args()
+    if (args.aeon or args.bma) and (args.csv or args.sif) and not args.formats:
+        # they are written from the SBML-qual model, which is not written
+        parser.error("-c and -s need SBML-qual output, use --formats with -a or -b")
+    if args.formats:
+        # as -s and -c, -a and -b add to the formats
+        for fmt, flag in (("aeon", args.aeon), ("bma", args.bma)):
+            if flag and fmt not in args.formats:
+                args.formats.append(fmt)
+        if args.outfile != sys.stdout:
+            base = args.outfile
+        elif args.infile != sys.stdin:
+            base = args.infile.name
+        else:
+            parser.error("--formats needs a file name for infile or outfile")
 
     if not args.debug:
         logger.disable("casq")
     logger.debug("parsing {fname}…", fname=args.infile.name)
-    info, width, height = read_celldesigner(args.infile)
-    simplify_model(info, args.upstream, args.downstream, args.names)
-    if args.infile != sys.stdin and args.outfile == sys.stdout:
-        if args.bma:
-            args.outfile = os.path.splitext(args.infile.name)[0] + ".bma.json"
-        elif args.aeon:
-            args.outfile = os.path.splitext(args.infile.name)[0] + ".aeon"
+    if args.low_memory:
+        reader = stream_celldesigner
+    else:
+        reader = read_celldesigner
+    if args.cache_dir and args.infile != sys.stdin:
+        info, width, height = read_simplified(
+            args.infile,
+            args.cache_dir,
+            args.upstream,
+            args.downstream,
+            args.names,
+            reader=reader,
+            max_size=args.cache_size * 2**20,
+            max_depth=args.max_depth,
+        )
+    else:
+        info, width, height = reader(args.infile)
+        simplify_model(info, args.upstream, args.downstream, args.names, args.max_depth)
+    if args.reduce:
+        fixed = fixpoints.read_fixed(args.fixed) if args.fixed else None
+        removed = reduce_model(info, fixed)
+        # fixed species are gone
+        args.fixed = None
+        if args.formats:
+            target = base
+        elif args.outfile != sys.stdout:
+            target = args.outfile
+        elif args.infile != sys.stdin:
+            target = args.infile.name
         else:
-            args.outfile = os.path.splitext(args.infile.name)[0] + ".sbml"
+            target = None
+        if target:
+            write_reduction(output_name(target, ".reduction.csv"), removed)
+    # once, after the model is final; fixed species only lose their function
+    logic = model_logic(info)
+    if args.formats:
+        write_formats(args.formats, base, (info, width, height), args, logic)
+        return
     if args.bma:
-        bmaExport.write_bma(
-            args.outfile, info, args.granularity, args.input, False, args.colourConstant
-        )
-    if args.aeon:
-        aeonExport.write_aeon(
-            args.outfile, info, False
-        )
+        fmt = "bma"
+    elif args.aeon:
+        fmt = "aeon"
     else:
-        write_qual(
-            args.outfile,
-            info,
-            width,
-            height,
-            remove=args.remove,
-            sif=args.sif,
-            fixed=args.fixed,
-        )
-    if args.csv and args.outfile != sys.stdout:
-        write_csv(args.outfile, info)
+        fmt = "sbml"
+    if args.infile != sys.stdin and args.outfile == sys.stdout:
+        args.outfile = output_name(args.infile.name, SUFFIXES[fmt])
+    write_model(fmt, args.outfile, info, width, height, args, logic)
 
 
 if __name__ == "__main__":  # pragma: no cover
-    main()
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""Symbolic enumeration of the fixed points of the Boolean models we derive.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import collections
+import csv
+import sys
+import time
+from typing import Collection, Dict, Iterator, List, Mapping, Optional
+
+from loguru import logger  # type: ignore
+
+from .logic import And, Not, Var, model_logic
+from .readCD import read_celldesigner
+from .simplify import simplify_model
+from .utils import open_file
+
+# fixed points as disjoint partial states, species left out being free, with
+# the number of fixed points they stand for, if all of them were found, and
+# the number of search nodes and of seconds it took
+FixedPoints = collections.namedtuple(
+    "FixedPoints", ["cubes", "count", "complete", "nodes", "seconds"]
+)
+
+
+def evaluate(function, values: Mapping[str, int]) -> Optional[int]:
+    """Return the value of function, or None if it depends on unknown species."""
+    if isinstance(function, Var):
+        return values.get(function.species)
+    if isinstance(function, Not):
+        value = values.get(function.species)
+        return None if value is None else 1 - value
+    # and is false as soon as one argument is, or (and catalysis) true
+    absorbing = 0 if isinstance(function, And) else 1
+    result = 1 - absorbing  # type: Optional[int]
+    for arg in function.args:
+        value = evaluate(arg, values)
+        if value == absorbing:
+            return absorbing
+        if value is None:
+            result = None
+    return result
+
+
+def variables(function) -> Iterator[str]:
+    """Yield the species function depends on."""
+    if isinstance(function, (Var, Not)):
+        yield function.species
+    else:
+        for arg in function.args:
+            yield from variables(arg)
+
+
+class Search:
+    """Depth-first search with propagation of the fixed point equations.
+
+    Each species s with a function f must satisfy s = f(s). Values are
+    propagated both ways through these equations, and the search branches on
+    a species of the first undetermined one, until all are satisfied whatever
+    the remaining species.
+    """
+
+    def __init__(self, logic: Mapping):
+        """Init."""
+        self.logic = logic
+        self.values = {}  # type: Dict[str, int]
+        self.trail = []  # type: List[str]
+        self.users = collections.defaultdict(list)  # type: Dict[str, List[str]]
+        for target, function in logic.items():
+            for species in set(variables(function)):
+                self.users[species].append(target)
+        self.nodes = 0
+
+    def assign(self, species: str, value: int, queue: List[str]) -> bool:
+        """Set species to value, checking the equations it appears in later."""
+        known = self.values.get(species)
+        if known is not None:
+            return known == value
+        self.values[species] = value
+        self.trail.append(species)
+        queue.extend(self.users[species])
+        if species in self.logic:
+            queue.append(species)
+        return True
+
+    def force(self, function, value: int, queue: List[str]) -> bool:
+        """Make function have value, if this fixes some of its species."""
+        if isinstance(function, Var):
+            return self.assign(function.species, value, queue)
+        if isinstance(function, Not):
+            return self.assign(function.species, 1 - value, queue)
+        absorbing = 0 if isinstance(function, And) else 1
+        if value != absorbing:
+            return all(self.force(arg, value, queue) for arg in function.args)
+        unknown = []
+        for arg in function.args:
+            current = evaluate(arg, self.values)
+            if current == absorbing:
+                return True
+            if current is None:
+                unknown.append(arg)
+        if len(unknown) == 1:
+            return self.force(unknown[0], value, queue)
+        return bool(unknown)
+
+    def propagate(self, queue: List[str]) -> bool:
+        """Propagate the equations of the species in queue, False on conflict."""
+        while queue:
+            target = queue.pop()
+            value = evaluate(self.logic[target], self.values)
+            if value is not None:
+                if not self.assign(target, value, queue):
+                    return False
+            elif target in self.values:
+                if not self.force(self.logic[target], self.values[target], queue):
+                    return False
+        return True
+
+    def try_value(self, species: str, value: int) -> bool:
+        """Assign and propagate a decision."""
+        queue = []  # type: List[str]
+        return self.assign(species, value, queue) and self.propagate(queue)
+
+    def undo(self, mark: int):
+        """Forget all values set after mark."""
+        while len(self.trail) > mark:
+            del self.values[self.trail.pop()]
+
+    def decision(self) -> Optional[str]:
+        """Return a species to branch on, or None if all equations hold."""
+        for target, function in self.logic.items():
+            if evaluate(function, self.values) is None:
+                if target not in self.values:
+                    return target
+                return next(s for s in variables(function) if s not in self.values)
+        return None
+
+    def solutions(self) -> Iterator[Dict[str, int]]:
+        """Yield disjoint partial states covering all fixed points."""
+        if not self.propagate(list(self.logic)):
+            return
+        # decisions left to undo, with the trail length before them and
+        # whether the other value remains to be tried
+        stack = []  # type: List
+        while True:
+            species = self.decision()
+            if species is None:
+                yield dict(self.values)
+            else:
+                self.nodes += 1
+                stack.append((len(self.trail), species, True))
+                if self.try_value(species, 0):
+                    continue
+            while stack:
+                mark, species, other = stack.pop()
+                self.undo(mark)
+                if other:
+                    stack.append((mark, species, False))
+                    if self.try_value(species, 1):
+                        break
+            else:
+                return
+
+
+def fixed_points(
+    info, fixed: Optional[Mapping[str, int]] = None, limit: Optional[int] = None
+) -> FixedPoints:
+    """Find the fixed points of a simplified model, at most limit cubes of them.
+
+    Species in fixed lose their function and keep the given level, unknown
+    ones are ignored.
+    Fixed points are the same for synchronous and asynchronous updates.
+    """
+    return logic_fixed_points(model_logic(info), info.keys(), fixed, limit)
+
+
+def logic_fixed_points(
+    logic: Mapping,
+    species: Collection[str],
+    fixed: Optional[Mapping[str, int]] = None,
+    limit: Optional[int] = None,
+) -> FixedPoints:
+    """Find the fixed points of the functions of logic, over all species."""
+    start = time.perf_counter()
+    levels = {}  # type: Dict[str, int]
+    for name, level in (fixed or {}).items():
+        if name in species:
+            levels[name] = level
+        else:
+            logger.warning(f"Unknown '{name}' could not be fixed.")
+    logic = {
+        target: function for target, function in logic.items() if target not in levels
+    }
+    search = Search(logic)
+    cubes = []
+    complete = True
+    if all(search.try_value(name, level) for name, level in levels.items()):
+        for cube in search.solutions():
+            cubes.append(cube)
+            if len(cubes) == limit:
+                complete = False
+                break
+    count = sum(2 ** (len(species) - len(cube)) for cube in cubes)
+    return FixedPoints(
+        cubes, count, complete, search.nodes, time.perf_counter() - start
+    )
+
+
+def write_fixed_points(outfile, info, cubes: List[Dict[str, int]]):
+    """Write one line per species, with its value in each cube, * if free."""
+    writer = csv.writer(outfile)
+    for species, data in info.items():
+        writer.writerow(
+            [species, data.name] + [cube.get(species, "*") for cube in cubes]
+        )
+
+
+def read_fixed(fixed) -> Dict[str, int]:
+    """Read the levels of a CSV file of fixed species, as for --fixed."""
+    return {row[0]: int(row[1]) for row in csv.reader(fixed) if row}
+
+
+def main(argv: List[str]) -> int:
+    """Print the fixed points of the model given on the command-line."""
+    parser = argparse.ArgumentParser(
+        prog="casq fixpoints",
+        description="Find the fixed points of the Boolean model of a CellDesigner map.",
+    )
+    parser.add_argument(
+        "-D", "--debug", action="store_true", help="Display a lot of debug information"
+    )
+    parser.add_argument(
+        "-f",
+        "--fixed",
+        type=argparse.FileType("r"),
+        help="A CSV file containing input values or knock-ins/knock-outs, as for casq",
+    )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="Stop after N sets of fixed points (defaults to 1000)",
+    )
+    parser.add_argument(
+        "infile", help="CellDesigner File, possibly compressed (.gz, .bz2, .xz or .zip)"
+    )
+    parser.add_argument(
+        "outfile",
+        nargs="?",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="CSV file, one line per species and one column per set of fixed points",
+    )
+    args = parser.parse_args(argv)
+    if not args.debug:
+        logger.disable("casq")
+    with open_file(args.infile) as f:
+        info, _width, _height = read_celldesigner(f)
+    simplify_model(info, [], [])
+    fixed = read_fixed(args.fixed) if args.fixed else {}
+    for species in fixed:
+        if species not in info:
+            print(f"Unknown '{species}' could not be fixed.", file=sys.stderr)
+            return 1
+    result = fixed_points(info, fixed, args.limit)
+    write_fixed_points(args.outfile, info, result.cubes)
+    print(
+        f"{'' if result.complete else 'at least '}"
+        f"{result.count} fixed points in {len(result.cubes)} sets, "
+        f"{result.nodes} search nodes, {result.seconds:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
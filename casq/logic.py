@@ -0,0 +1,209 @@
+"""Boolean logic of species, shared by all exporters.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import xml.etree.ElementTree as etree
+from typing import AbstractSet, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger  # type: ignore
+
+from .readCD import Transition
+
+INHIBITION = ("INHIBITION", "UNKNOWN_INHIBITION")
+NEGATIVE = ("INHIBITION", "NEGATIVE_INFLUENCE", "UNKNOWN_INHIBITION")
+AND_GATE = "BOOLEAN_LOGIC_GATE_AND"
+
+# a species being active, or inactive
+Var = collections.namedtuple("Var", ["species"])
+Not = collections.namedtuple("Not", ["species"])
+And = collections.namedtuple("And", ["args"])
+# the reactions of a species, one of them is enough
+Or = collections.namedtuple("Or", ["args"])
+# the catalysts of a reaction, one of them is enough too but some formats leave
+# their exact role unspecified
+Catalysis = collections.namedtuple("Catalysis", ["args"])
+
+
+def species_logic(transitions: List[Transition], known: AbstractSet[str]):
+    """Return the Boolean activation function of a species.
+
+    This is an or over all reactions having the target as product.
+    For each reaction it can activate if all reactants are present,
+    no inhibitor is present, and one of the activators is present.
+    Return None if there is nothing known to depend on.
+    """
+    clauses = [
+        clause
+        for clause in (reaction_logic(reaction, known) for reaction in transitions)
+        if clause is not None
+    ]
+    if len(transitions) > 1:
+        return Or(tuple(clauses))
+    if clauses:
+        return clauses[0]
+    return None
+
+
+def reaction_logic(reaction: Transition, known: AbstractSet[str]):
+    """Return the condition for a single reaction to activate its product."""
+    reactants, activators, inhibitors = reaction_roles(reaction, known)
+    args = [Var(reac) for reac in reactants]
+    if len(activators) > 1:
+        args.insert(0, Catalysis(tuple(Var(act) for act in activators)))
+    elif activators:
+        args.append(Catalysis((Var(activators[0]),)))
+    args.extend(Not(inhib) for inhib in inhibitors)
+    if len(args) > 1:
+        return And(tuple(args))
+    if args:
+        return args[0]
+    return None
+
+
+def reaction_roles(
+    reaction: Transition, known: AbstractSet[str]
+) -> Tuple[List[str], List[str], List[str]]:
+    """Return the species a reaction needs, needs one of, and is prevented by."""
+    # we assume that only "BOOLEAN_LOGIC_GATE_AND" has multiple modifiers
+    # it is also the only modification that has an AND and therefore ends
+    # with reactants
+    reactants = [reac for reac in reaction.reactants if reac in known]
+    reactants.extend(
+        mod
+        for (modtype, modifier) in reaction.modifiers
+        if modtype == AND_GATE
+        for mod in modifier.split(",")
+        if mod in known
+    )
+    # AND gate members are often reactants too
+    reactants = list(dict.fromkeys(reactants))
+    # reactants of inhibitions become inhibitors, activators still count
+    used = set() if reaction.type in NEGATIVE else set(reactants)
+    activators = [
+        modifier
+        for (modtype, modifier) in reaction.modifiers
+        if modtype not in INHIBITION
+        and modtype != AND_GATE
+        and modifier in known
+        and modifier not in used
+    ]
+    inhibitors = [
+        modifier
+        for (modtype, modifier) in reaction.modifiers
+        if modtype in INHIBITION and modifier in known
+    ]
+    # this should only appear when species is of type PHENOTYPE otherwise
+    # non-SBGN compliant, and there should be a single reactant and no inhibitors
+    # just swap reactants and inhibitors, there should not be any activator
+    if reaction.type in NEGATIVE:
+        reactants, inhibitors = inhibitors, reactants
+        if activators or reactants:
+            logger.error("non-SBGN direct inhibition encountered")
+    return reactants, activators, inhibitors
+
+
+def model_logic(info) -> Dict[str, object]:
+    """Return the activation function of all species that have one."""
+    known = info.keys()
+    logic = {}
+    for species, data in info.items():
+        function = species_logic(data.transitions, known)
+        if function is not None:
+            logic[species] = function
+    return logic
+
+
+def without(function, species: str):
+    """Return function where species is ignored, or None if nothing is left."""
+    if isinstance(function, (Var, Not)):
+        if function.species == species:
+            return None
+        return function
+    args = tuple(arg for arg in (without(arg, species) for arg in function.args) if arg)
+    if not args:
+        return None
+    return function._replace(args=args)
+
+
+def to_mathml(function, parent: etree.Element):
+    """Add the MathML version of function to parent."""
+    if isinstance(function, (Var, Not)):
+        trigger = etree.SubElement(parent, "apply")
+        etree.SubElement(trigger, "eq")
+        math_ci = etree.SubElement(trigger, "ci")
+        math_ci.text = function.species
+        math_cn = etree.SubElement(trigger, "cn", type="integer")
+        math_cn.text = "1" if isinstance(function, Var) else "0"
+    elif isinstance(function, Catalysis) and len(function.args) == 1:
+        to_mathml(function.args[0], parent)
+    else:
+        apply = etree.SubElement(parent, "apply")
+        etree.SubElement(apply, "and" if isinstance(function, And) else "or")
+        for arg in function.args:
+            to_mathml(arg, apply)
+
+
+def to_ginsim(function, name: Callable[[str], Optional[str]]) -> str:
+    """Return the GINsim (and bnet) version of function."""
+    if isinstance(function, Var):
+        return name(function.species) or ""
+    if isinstance(function, Not):
+        return "!" + (name(function.species) or "")
+    if isinstance(function, Catalysis) and len(function.args) == 1:
+        return to_ginsim(function.args[0], name)
+    if isinstance(function, And):
+        return "&".join(to_ginsim(arg, name) for arg in function.args)
+    return "(" + "|".join(to_ginsim(arg, name) for arg in function.args) + ")"
+
+
+def to_bma(function, ident: Callable[[str], int]) -> str:
+    """Return the BMA version of function, using n-ary min for and, max for or."""
+    if isinstance(function, Var):
+        return f"var({ident(function.species)})"
+    if isinstance(function, Not):
+        return f"1-var({ident(function.species)})"
+    if len(function.args) == 1:
+        return to_bma(function.args[0], ident)
+    if isinstance(function, And):
+        operator, neutral = "min", "1"
+    else:
+        operator, neutral = "max", "0"
+    if not function.args:
+        return neutral
+    return operator + "(" + ",".join(to_bma(arg, ident) for arg in function.args) + ")"
+
+
+def to_aeon(
+    function, name: Callable[[str], str], unknown: Callable[[List[str]], str]
+) -> str:
+    """Return the AEON version of function.
+
+    Catalysts are the arguments of an unknown function, named by unknown.
+    """
+    if isinstance(function, Var):
+        return name(function.species)
+    if isinstance(function, Not):
+        return "!" + name(function.species)
+    if isinstance(function, Catalysis):
+        return unknown([name(arg.species) for arg in function.args])
+    if len(function.args) == 1:
+        return to_aeon(function.args[0], name, unknown)
+    operator = " & " if isinstance(function, And) else " | "
+    return (
+        "(" + operator.join(to_aeon(arg, name, unknown) for arg in function.args) + ")"
+    )
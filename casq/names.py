@@ -0,0 +1,51 @@
+"""Normalisation of species names for the formats with restricted identifiers.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from functools import lru_cache
+
+GREEK_ALPHABET = "ΑαΒβΓγΔδΕεΖζΗηΘθΙιΚκΛλΜμΝνΞξΟοΠπΡρΣσςΤτΥυΦφΧχΨψΩω"
+LATIN_ALPHABET = "AaBbGgDdEeZzHhJjIiKkLlMmNnXxOoPpRrSssTtUuFfQqYyWw"
+GREEK_TO_LATIN = str.maketrans(GREEK_ALPHABET, LATIN_ALPHABET)
+PUNCTUATION = " ,-()+:/\\'[]><"
+DEPUNCTUATE = str.maketrans(PUNCTUATION, "_" * len(PUNCTUATION))
+NON_ALPHANUMERIC = re.compile("[^0-9a-zA-Z_]")
+# the same names come back for each model of a batch
+CACHE_SIZE = 2**16
+
+
+def translate_greek(name: str) -> str:
+    """Translate Greek to Latin alphabet."""
+    return name.translate(GREEK_TO_LATIN)
+
+
+def depunctuate(name: str) -> str:
+    """Replace punctuation by underscores."""
+    return name.translate(DEPUNCTUATE)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def bma_name(name: str) -> str:
+    """Remove punctuation and replace Greek letters."""
+    return translate_greek(depunctuate(name))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def aeon_name(name: str) -> str:
+    """Replace Greek letters and all other non-alphanumeric characters."""
+    return NON_ALPHANUMERIC.sub("_", translate_greek(name))
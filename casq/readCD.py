@@ -17,12 +17,17 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import collections
+import collections.abc
+import functools
+import sys
 import xml.etree.ElementTree as etree
 from itertools import chain
-from typing import IO, List, Optional
+from typing import IO, Dict, List, Optional, Tuple  # noqa: F401
 
 from loguru import logger  # type: ignore
 
+from . import backend
+
 NS = {
     "sbml": "http://www.sbml.org/sbml/level2/version4",
     "cd": "http://www.sbml.org/2001/ns/celldesigner",
@@ -43,126 +48,434 @@ Transition = collections.namedtuple(
     "Transition", ["type", "reactants", "modifiers", "notes", "annotations"]
 )
 
+SBMLSpecies = collections.namedtuple(
+    "SBMLSpecies",
+    ["name", "type", "protein", "modifications", "activity", "annotations"],
+)
+
+Alias = collections.namedtuple(
+    "Alias", ["id", "species", "compartment", "x", "y", "h", "w"]
+)
+
+Reaction = collections.namedtuple(
+    "Reaction",
+    ["id", "type", "reactants", "products", "modifiers", "notes", "annotations"],
+)
+
+
+class Species(collections.abc.MutableMapping):
+    """A species of the model.
+
+    Fields are slots, so that large models stay small in memory, but they can
+    still be used as the keys of the dict this used to be, i.e. species.name
+    and species["name"] are the same.
+    """
+
+    __slots__ = (
+        "activity",
+        "x",
+        "y",
+        "h",
+        "w",
+        "transitions",
+        "name",
+        "function",
+        "ref_species",
+        "type",
+        "modifications",
+        "receptor",
+        "annotations",
+        "compartment",
+        "clean_name",
+    )
+
+    def __init__(self, **fields):
+        """Init."""
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        """Return field key."""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        """Set field key."""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        """Unset field key."""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        """Iterate over the fields that are set."""
+        return (key for key in self.__slots__ if hasattr(self, key))
+
+    def __len__(self):
+        """Count the fields that are set."""
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        """Show like a dict."""
+        return f"Species({dict(self)!r})"
+
+
+Index = collections.namedtuple(
+    "Index",
+    [
+        "species",
+        "aliases",
+        "complexes",
+        "complexes_by_species",
+        "compartments",
+        "proteins",
+        "included",
+    ],
+)
+
+
+@functools.lru_cache(maxsize=None)
+def query(path: str) -> backend.Path:
+    """Compile a fixed path over our namespaces for the XML backend, once."""
+    return backend.Path(path, NS)
+
+
+def tag(prefix: str, name: str) -> str:
+    """Return the fully qualified tag of name in namespace prefix."""
+    return "{" + NS[prefix] + "}" + name
+
+
+SBML = tag("sbml", "sbml")
+MODEL = tag("sbml", "model")
+DISPLAY_PATH = [
+    SBML,
+    MODEL,
+    tag("sbml", "annotation"),
+    tag("cd", "extension"),
+    tag("cd", "modelDisplay"),
+]
+COMPARTMENT_ALIAS = (
+    tag("cd", "listOfCompartmentAliases"),
+    tag("cd", "compartmentAlias"),
+)
+COMPLEX_ALIAS = (
+    tag("cd", "listOfComplexSpeciesAliases"),
+    tag("cd", "complexSpeciesAlias"),
+)
+SPECIES_ALIAS = (tag("cd", "listOfSpeciesAliases"), tag("cd", "speciesAlias"))
+PROTEIN = (tag("cd", "listOfProteins"), tag("cd", "protein"))
+INCLUDED_SPECIES = (tag("cd", "listOfIncludedSpecies"), tag("cd", "species"))
+COMPARTMENT = (tag("sbml", "listOfCompartments"), tag("sbml", "compartment"))
+SPECIES = (tag("sbml", "listOfSpecies"), tag("sbml", "species"))
+REACTION = (tag("sbml", "listOfReactions"), tag("sbml", "reaction"))
+RECORDS = {
+    COMPARTMENT_ALIAS,
+    COMPLEX_ALIAS,
+    SPECIES_ALIAS,
+    PROTEIN,
+    INCLUDED_SPECIES,
+    COMPARTMENT,
+    SPECIES,
+    REACTION,
+}
+
 
 def read_celldesigner(fileobj: IO):
     """Parse the given file."""
-    root = etree.parse(fileobj).getroot()
-    tag = root.tag
-    if tag != "{" + NS["sbml"] + "}sbml":
+    root = backend.parse(fileobj)
+    if root.tag != SBML:
         raise ValueError("Currently limited to SBML Level 2 Version 4")
-    model = root.find("sbml:model", NS)
+    model = query("sbml:model").find(root)
     if model is not None:
-        display = model.find("./sbml:annotation/cd:extension/cd:modelDisplay", NS)
+        display = query("./sbml:annotation/cd:extension/cd:modelDisplay").find(model)
     else:
         raise ValueError("Could not find SBML model element")
     if display is None:
         raise ValueError("Could not find CellDesigner modelDisplay element")
+    index = build_index(model)
     return (
-        get_transitions(model, species_info(model)),
+        get_transitions(model, species_info(model, index), index),
         display.get("sizeX"),
         display.get("sizeY"),
     )
 
 
-def species_info(model):
-    """Create a map from species' ids to their attributes."""
-    nameconv = {}
-    compartments = {}
-    # Find all CellDesigner species used later
-    for species in chain(
-        model.findall(
+def stream_celldesigner(fileobj: IO):
+    """Parse the given file incrementally, with the same result as read_celldesigner.
+
+    Species, aliases, compartments and reactions are turned into compact
+    records as soon as they are complete, and their XML is then dropped, so
+    that only the RDF annotations and notes used later stay in memory.
+    """
+    species = {}  # type: Dict[str, Optional[SBMLSpecies]]
+    complexes = {}  # type: Dict[str, Optional[str]]
+    complexes_by_species = {}  # type: Dict[str, Optional[str]]
+    aliases = {COMPLEX_ALIAS: [], SPECIES_ALIAS: []}  # type: Dict[Tuple, List[Alias]]
+    compartment_ids = {}  # type: Dict[str, str]
+    compartment_names = {}  # type: Dict[str, str]
+    proteins = {}  # type: Dict[str, str]
+    included = []  # type: List[Tuple[str, etree.Element]]
+    reactions = []  # type: List[Reaction]
+    display = None
+    has_model = False
+    stack = []  # type: List[etree.Element]
+    record = None
+    for event, elem in backend.iterparse(fileobj):
+        if event == "start":
+            if not stack:
+                if elem.tag != SBML:
+                    raise ValueError("Currently limited to SBML Level 2 Version 4")
+            elif record is None and (stack[-1].tag, elem.tag) in RECORDS:
+                record = elem
+            elif len(stack) == 1 and elem.tag == MODEL:
+                has_model = True
+            elif (
+                elem.tag == DISPLAY_PATH[-1]
+                and [e.tag for e in stack] == DISPLAY_PATH[:-1]
+            ):
+                display = (elem.get("sizeX"), elem.get("sizeY"))
+            stack.append(elem)
+            continue
+        stack.pop()
+        if not stack:
+            break
+        if record is not None:
+            if elem is not record:
+                continue
+            record = None
+            kind = (stack[-1].tag, elem.tag)
+            if kind in (COMPLEX_ALIAS, SPECIES_ALIAS):
+                if kind == SPECIES_ALIAS:
+                    cmplx = elem.get("complexSpeciesAlias")
+                    complexes.setdefault(elem.get("id"), cmplx)
+                    complexes_by_species.setdefault(elem.get("species"), cmplx)
+                alias = read_alias(elem)
+                if alias is not None:
+                    aliases[kind].append(alias)
+            elif kind == SPECIES:
+                species.setdefault(elem.get("id"), read_species(elem))
+            elif kind == REACTION:
+                reaction = read_reaction(elem)
+                if reaction is not None:
+                    reactions.append(reaction)
+            elif kind == COMPARTMENT_ALIAS:
+                compartment_ids.setdefault(elem.get("id"), elem.get("compartment"))
+            elif kind == COMPARTMENT:
+                compartment_names.setdefault(elem.get("id"), elem.get("name"))
+            elif kind == PROTEIN:
+                proteins.setdefault(elem.get("id"), elem.get("type"))
+            elif kind == INCLUDED_SPECIES:
+                subcomponent = read_included(elem)
+                if subcomponent is not None:
+                    included.append(subcomponent)
+        # keep memory bounded, its earlier siblings are already gone
+        stack[-1].remove(elem)
+    if not has_model:
+        raise ValueError("Could not find SBML model element")
+    if display is None:
+        raise ValueError("Could not find CellDesigner modelDisplay element")
+    index = Index(
+        species,
+        aliases[COMPLEX_ALIAS] + aliases[SPECIES_ALIAS],
+        complexes,
+        complexes_by_species,
+        resolve_compartments(compartment_ids, compartment_names),
+        proteins,
+        included,
+    )
+    info = species_info(None, index)
+    for reaction in reactions:
+        add_reaction(info, reaction, index)
+    return info, display[0], display[1]
+
+
+def build_index(model: etree.Element) -> Index:
+    """Index all elements later looked up by id, in a single pass each.
+
+    When an id appears several times, the first one in document order wins,
+    as it would with model.find.
+    """
+    species = {}
+    for sbml in query("./sbml:listOfSpecies/sbml:species").findall(model):
+        species.setdefault(sbml.get("id"), read_species(sbml))
+    aliases = []
+    for element in chain(
+        query(
             "./sbml:annotation/cd:extension/"
             + "cd:listOfComplexSpeciesAliases/"
-            + "cd:complexSpeciesAlias",
-            NS,
-        ),
-        model.findall(
+            + "cd:complexSpeciesAlias"
+        ).findall(model),
+        query(
             "./sbml:annotation/cd:extension/"
             + "cd:listOfSpeciesAliases/"
-            + "cd:speciesAlias",
-            NS,
-        ),
+            + "cd:speciesAlias"
+        ).findall(model),
     ):
-        bound = species.find(".//cd:bounds", NS)
-        in_complex = species.get("complexSpeciesAlias")
-        if bound is None or in_complex is not None:
-            continue
-        ref_species = species.get("species")
+        alias = read_alias(element)
+        if alias is not None:
+            aliases.append(alias)
+    # only plain species aliases can be found inside a complex
+    complexes = {}
+    complexes_by_species = {}
+    for element in query(
+        "./sbml:annotation/cd:extension/"
+        + "cd:listOfSpeciesAliases/"
+        + "cd:speciesAlias"
+    ).findall(model):
+        cmplx = element.get("complexSpeciesAlias")
+        complexes.setdefault(element.get("id"), cmplx)
+        complexes_by_species.setdefault(element.get("species"), cmplx)
+    compartment_names = {}
+    for compartment in query(".//sbml:compartment").findall(model):
+        compartment_names.setdefault(compartment.get("id"), compartment.get("name"))
+    compartment_ids = {}
+    for alias in query(".//cd:compartmentAlias").findall(model):
+        compartment_ids.setdefault(alias.get("id"), alias.get("compartment"))
+    proteins = {}
+    for protein in query(".//cd:protein").findall(model):
+        proteins.setdefault(protein.get("id"), protein.get("type"))
+    included = []
+    for cd_species in query(
+        "./sbml:annotation/cd:extension/cd:listOfIncludedSpecies/cd:species"
+    ).findall(model):
+        subcomponent = read_included(cd_species)
+        if subcomponent is not None:
+            included.append(subcomponent)
+    return Index(
+        species,
+        aliases,
+        complexes,
+        complexes_by_species,
+        resolve_compartments(compartment_ids, compartment_names),
+        proteins,
+        included,
+    )
+
+
+def resolve_compartments(compartment_ids, compartment_names):
+    """Map CD compartment aliases to the name of their SBML compartment."""
+    return {
+        alias: compartment_names[sbml_id]
+        for alias, sbml_id in compartment_ids.items()
+        if sbml_id in compartment_names
+    }
+
+
+def read_species(sbml: etree.Element) -> Optional[SBMLSpecies]:
+    """Extract what we need from an SBML species, if it is annotated."""
+    annot = query("./sbml:annotation").find(sbml)
+    if annot is None:
+        return None
+    activity = query(".//cd:structuralState").find(annot)
+    if activity is not None:
+        activity = activity.get("structuralState")
+    else:
+        activity = "inactive"
+    return SBMLSpecies(
+        sbml.get("name"),
+        get_text(query(".//cd:class").find(annot), "PROTEIN"),
+        get_text(query(".//cd:proteinReference").find(annot)),
+        get_mods(query(".//cd:listOfModifications").find(annot)),
+        activity,
+        backend.native(query(".//rdf:RDF").find(annot)),
+    )
+
+
+def read_alias(species: etree.Element) -> Optional[Alias]:
+    """Extract a drawn CD species alias, unless it is inside a complex."""
+    bound = query(".//cd:bounds").find(species)
+    if bound is None or species.get("complexSpeciesAlias") is not None:
+        return None
+    return Alias(
+        species.get("id"),
+        species.get("species"),
+        species.get("compartmentAlias"),
+        bound.get("x"),
+        bound.get("y"),
+        bound.get("h"),
+        bound.get("w"),
+    )
+
+
+def read_included(species: etree.Element):
+    """Extract the id and RDF annotation of an annotated complex subcomponent."""
+    if query("./cd:notes/xhtml:html/xhtml:body/rdf:RDF").find(species) is None:
+        return None
+    return species.get("id", ""), backend.native(query(".//rdf:RDF").find(species))
+
+
+def species_info(model, index: Optional[Index] = None):
+    """Create a map from species' ids to their attributes."""
+    if index is None:
+        index = build_index(model)
+    nameconv = {}
+    # Find all CellDesigner species used later
+    for alias in index.aliases:
+        ref_species = sys.intern(alias.species)
         logger.debug("parsing ref_species: {ref}", ref=ref_species)
-        sbml = model.find(
-            './sbml:listOfSpecies/sbml:species[@id="' + ref_species + '"]', NS
-        )
+        sbml = index.species.get(ref_species)
         if sbml is None:
             continue
-        annot = sbml.find("./sbml:annotation", NS)
-        if annot is None:
-            continue
-        classtype = get_text(annot.find(".//cd:class", NS), "PROTEIN")
+        classtype = sbml.type
         if classtype == "DEGRADED":
             continue
         if classtype == "PROTEIN":
-            is_receptor = find_protein_type(annot, model) == "RECEPTOR"
+            is_receptor = find_protein_type(sbml, index) == "RECEPTOR"
         else:
             is_receptor = False
-        mods = get_mods(annot.find(".//cd:listOfModifications", NS))
-        activity = annot.find(".//cd:structuralState", NS)
-        if activity is not None:
-            activity = activity.get("structuralState")
-        else:
-            activity = "inactive"
-        name = make_name_precise(sbml.get("name"), classtype, mods)
-        comp_id = species.get("compartmentAlias")
-        if comp_id in compartments:
-            compartment = compartments[comp_id]
-        else:
-            compartment = find_compartment(comp_id, model)
-            compartments[comp_id] = compartment
-        species_id = species.get("id")
-        nameconv[species_id] = {
-            "activity": activity,
-            "x": bound.get("x"),
-            "y": bound.get("y"),
-            "h": bound.get("h"),
-            "w": bound.get("w"),
-            "transitions": [],
-            "name": name,
-            "function": name,
-            "ref_species": ref_species,
-            "type": classtype,
-            "modifications": mods,
-            "receptor": is_receptor,
-            "annotations": annot.find(".//rdf:RDF", NS),
-            "compartment": compartment,
-        }
+        mods = sbml.modifications
+        name = make_name_precise(sbml.name, classtype, mods)
+        compartment = find_compartment(alias.compartment, index)
+        nameconv[sys.intern(alias.id)] = Species(
+            activity=sbml.activity,
+            x=alias.x,
+            y=alias.y,
+            h=alias.h,
+            w=alias.w,
+            transitions=[],
+            name=name,
+            function=name,
+            ref_species=ref_species,
+            type=classtype,
+            modifications=mods,
+            receptor=is_receptor,
+            annotations=sbml.annotations,
+            compartment=compartment,
+        )
         # also store in nameconv the reverse mapping from SBML species to CD
         # species using the corresponding reference protein
-        prot_ref = "__" + sbml.get("name")
+        prot_ref = "__" + sbml.name
         if prot_ref in nameconv:
-            nameconv[prot_ref].append(species.get("id"))
+            nameconv[prot_ref].append(alias.id)
         else:
-            nameconv[prot_ref] = [species.get("id")]
-    add_subcomponents_only(nameconv, model)
+            nameconv[prot_ref] = [alias.id]
+    add_subcomponents_only(nameconv, index)
     return nameconv
 
 
-def find_protein_type(annotation, model):
-    """Look for the cd:protein type for an annotation's reference protein."""
-    ref = get_text(annotation.find(".//cd:proteinReference", NS))
-    if ref:
-        protein = model.find('.//cd:protein[@id="' + ref + '"]', NS)
-        if protein is not None:
-            return protein.get("type")
+def find_protein_type(species: SBMLSpecies, index: Index):
+    """Look for the cd:protein type for a species' reference protein."""
+    if species.protein and species.protein in index.proteins:
+        return index.proteins[species.protein]
     return "GENERIC"
 
 
-def find_compartment(comp_id, model):
+def find_compartment(comp_id, index: Index):
     """Look for the name of the SBML compartment associated to a CD one."""
     if comp_id is None:
         return "default_compartment"
-    sbml_id = model.find('.//cd:compartmentAlias[@id="' + comp_id + '"]', NS).get(
-        "compartment"
-    )
-    return model.find('.//sbml:compartment[@id="' + sbml_id + '"]', NS).get("name")
+    return index.compartments[comp_id]
 
 
 def make_name_precise(name, ctype, mods):
@@ -182,22 +495,16 @@ def make_name_precise(name, ctype, mods):
     return "_".join(basis + mods)
 
 
-def add_subcomponents_only(nameconv, model: etree.Element):
+def add_subcomponents_only(nameconv, index: Index):
     """Add annotations to the parent complex.
 
     For unused CD species (only subcomponents of complexes)
     """
-    for species in model.findall(
-        "./sbml:annotation/cd:extension/"
-        + "cd:listOfIncludedSpecies/cd:species/"
-        + "cd:notes/xhtml:html/xhtml:body/"
-        + "rdf:RDF/../../../..",
-        NS,
-    ):
+    for species_id, rdf in index.included:
         add_rdf(
             nameconv,
-            reference=decomplexify(species.get("id", ""), model, field="species"),
-            new_rdf=species.find(".//rdf:RDF", NS),
+            reference=decomplexify(species_id, index, field="species"),
+            new_rdf=rdf,
         )
 
 
@@ -206,7 +513,7 @@ def add_rdf(nameconv, reference: str, new_rdf: Optional[etree.Element]):
     # reference might still be a complex, then we ignore it (is this correct?)
     if new_rdf is None or reference not in nameconv:
         return
-    if nameconv[reference]["annotations"] is not None:
+    if nameconv[reference].annotations is not None:
         rdfs = new_rdf.find("./rdf:Description", NS)
         if rdfs is None:
             return
@@ -215,68 +522,89 @@ def add_rdf(nameconv, reference: str, new_rdf: Optional[etree.Element]):
             rdfs=rdfs[:],
             reference=reference,
         )
-        description = nameconv[reference]["annotations"].find("./rdf:Description", NS)
+        description = nameconv[reference].annotations.find("./rdf:Description", NS)
         for element in rdfs[:]:
             if element not in description:
                 description.append(element)
     else:
-        nameconv[reference]["annotations"] = new_rdf
+        nameconv[reference].annotations = new_rdf
 
 
-def get_transitions(model: etree.Element, info):
+def get_transitions(model: etree.Element, info, index: Optional[Index] = None):
     """Find all transitions."""
-    for trans in model.findall("./sbml:listOfReactions/sbml:reaction", NS):
-        logger.debug("parsing reaction: {tid}", tid=trans.get("id"))
-        annot = trans.find("./sbml:annotation/cd:extension", NS)
-        if annot is None:
-            continue
-        rtype = get_text(annot.find("./cd:reactionType", NS))
-        reacs = [
-            decomplexify(reac.get("alias", ""), model)
+    if index is None:
+        index = build_index(model)
+    for trans in query("./sbml:listOfReactions/sbml:reaction").findall(model):
+        reaction = read_reaction(trans)
+        if reaction is not None:
+            add_reaction(info, reaction, index)
+    return info
+
+
+def read_reaction(trans: etree.Element) -> Optional[Reaction]:
+    """Extract the CD aliases, notes and annotations of a reaction."""
+    logger.debug("parsing reaction: {tid}", tid=trans.get("id"))
+    annot = query("./sbml:annotation/cd:extension").find(trans)
+    if annot is None:
+        return None
+    return Reaction(
+        trans.get("id"),
+        get_text(query("./cd:reactionType").find(annot)),
+        [
+            reac.get("alias", "")
             for reac in chain(
-                annot.findall("./cd:baseReactants/cd:baseReactant", NS),
-                annot.findall("./cd:listOfReactantLinks/cd:reactantLink", NS),
+                query("./cd:baseReactants/cd:baseReactant").findall(annot),
+                query("./cd:listOfReactantLinks/cd:reactantLink").findall(annot),
             )
-        ]
-        prods = [
-            decomplexify(prod.get("alias", ""), model)
+        ],
+        [
+            prod.get("alias", "")
             for prod in chain(
-                annot.findall("./cd:baseProducts/cd:baseProduct", NS),
-                annot.findall("./cd:listOfProductLinks/cd:productLink", NS),
-            )
-        ]
-        mods = [
-            (mod.get("type"), decomplexify(mod.get("aliases", ""), model))
-            for mod in annot.findall("./cd:listOfModification/cd:modification", NS)
-        ]
-        notes = trans.find("./sbml:notes//xhtml:body", NS)
-        rdf = trans.find("./sbml:annotation/rdf:RDF", NS)
-        # remove degraded
-        reacs = list(filter(lambda x: x in info, reacs))
-        prods = list(filter(lambda x: x in info, prods))
-        # for each product of a reaction, add this reaction as a transition
-        # affecting that species
-        for species in prods:
-            info[species]["transitions"].append(
-                Transition(rtype, reacs, mods, notes, rdf)
+                query("./cd:baseProducts/cd:baseProduct").findall(annot),
+                query("./cd:listOfProductLinks/cd:productLink").findall(annot),
             )
-    return info
+        ],
+        [
+            (mod.get("type"), mod.get("aliases", ""))
+            for mod in query("./cd:listOfModification/cd:modification").findall(annot)
+        ],
+        backend.native(query("./sbml:notes//xhtml:body").find(trans)),
+        backend.native(query("./sbml:annotation/rdf:RDF").find(trans)),
+    )
+
+
+def add_reaction(info, reaction: Reaction, index: Index):
+    """Add a reaction as a transition of each of its products."""
+    reacs = [decomplexify(reac, index) for reac in reaction.reactants]
+    prods = [decomplexify(prod, index) for prod in reaction.products]
+    mods = tuple(
+        (modtype, sys.intern(decomplexify(mod, index)))
+        for modtype, mod in reaction.modifiers
+    )
+    # remove degraded
+    reacs = tuple(sys.intern(x) for x in reacs if x in info)
+    prods = [x for x in prods if x in info]
+    # for each product of a reaction, add this reaction as a transition
+    # affecting that species, transitions being immutable they can be shared
+    transition = Transition(
+        reaction.type, reacs, mods, reaction.notes, reaction.annotations
+    )
+    for species in prods:
+        info[species].transitions.append(transition)
 
 
-def decomplexify(species: str, model: etree.Element, field: str = "id"):
+def decomplexify(species: str, index: Index, field: str = "id"):
     """Return external complex if there is one.
 
     or species unchanged otherwise.
     """
-    cmplx = model.find(
-        "./sbml:annotation/cd:extension/"
-        + "cd:listOfSpeciesAliases/"
-        + f'cd:speciesAlias[@{field}="{species}"]',
-        NS,
-    )
+    if field == "species":
+        cmplx = index.complexes_by_species.get(species)
+    else:
+        cmplx = index.complexes.get(species)
     if cmplx is None:
         return species
-    return cmplx.get("complexSpeciesAlias", species)
+    return cmplx
 
 
 def get_text(cd_class: Optional[etree.Element], default=None):
@@ -291,5 +619,6 @@ def get_mods(cd_modifications: etree.Element) -> List[str]:
     if cd_modifications is None:
         return []
     return [
-        mod.get("state", "") for mod in cd_modifications.findall("cd:modification", NS)
+        mod.get("state", "")
+        for mod in query("cd:modification").findall(cd_modifications)
     ]
@@ -0,0 +1,243 @@
+"""Static reduction of simplified models before they are exported.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import csv
+from typing import AbstractSet, Dict, Mapping, Optional
+
+from loguru import logger  # type: ignore
+
+from .logic import AND_GATE, INHIBITION, NEGATIVE, reaction_roles
+from .readCD import Transition
+from .simplify import replace_in_transition
+from .utils import open_file
+
+# what became of a removed species: its constant value, or the species it was
+# merged into, or neither if nothing used it
+Reduction = collections.namedtuple("Reduction", ["name", "value", "into"])
+
+
+def reduce_model(
+    info,
+    fixed: Optional[Mapping[str, int]] = None,
+    keep: Optional[AbstractSet[str]] = None,
+) -> Dict[str, Reduction]:
+    """Remove the species of a simplified model that are not needed.
+
+    Fixed species, and those their levels determine, are removed and their
+    value used in the transitions of the others. Species that just copy
+    another one are merged into it. Species that nothing uses are removed,
+    unless they are in keep, which defaults to the phenotypes, and only if
+    there is something to keep.
+    Return what became of each removed species.
+    """
+    if keep is None:
+        keep = {key for key, data in info.items() if data.type == "PHENOTYPE"}
+    removed = {}  # type: Dict[str, Reduction]
+    constants = {}
+    for species, level in (fixed or {}).items():
+        if species in info:
+            constants[species] = int(level)
+        else:
+            logger.warning(f"Unknown '{species}' could not be fixed.")
+    changed = True
+    while changed:
+        changed = percolate(info, constants, removed)
+        constants = {}
+        changed = merge_copies(info, keep, removed) or changed
+        if keep:
+            changed = remove_unused(info, keep, removed) or changed
+    for species, reduction in removed.items():
+        into = reduction.into
+        while into in removed:
+            reduction = reduction._replace(
+                value=removed[into].value, into=removed[into].into
+            )
+            into = reduction.into
+        removed[species] = reduction
+    logger.debug("reduction removed {n} species", n=len(removed))
+    return removed
+
+
+def percolate(info, constants: Dict[str, int], removed: Dict[str, Reduction]) -> bool:
+    """Remove constant species, and those they determine, from the model."""
+    values = {}  # type: Dict[str, int]
+    while constants:
+        for species, level in constants.items():
+            logger.debug("{sp} is constant {lvl}", sp=species, lvl=level)
+            removed[species] = Reduction(info[species].name, level, None)
+            del info[species]
+        values.update(constants)
+        known = info.keys() | values.keys()
+        constants = {}
+        fixed = {}  # type: Dict[int, Optional[Transition]]
+        for species, data in info.items():
+            transitions = []
+            for trans in data.transitions:
+                # transitions are shared by all products of a reaction
+                if id(trans) not in fixed:
+                    fixed[id(trans)] = fix_transition(trans, values, known)
+                new = fixed[id(trans)]
+                if new is None:
+                    continue
+                if new is not trans and not any(reaction_roles(new, info.keys())):
+                    # nothing is left to wait for
+                    constants[species] = 1
+                transitions.append(new)
+            if data.transitions and not transitions:
+                # species with no transition left cannot be produced anymore
+                constants[species] = 0
+            data.transitions = transitions
+    return bool(values)
+
+
+def fix_transition(
+    trans: Transition, values: Mapping[str, int], known: AbstractSet[str]
+) -> Optional[Transition]:
+    """Return trans without the species of values, None if it cannot happen."""
+    reactants, activators, inhibitors = reaction_roles(trans, known)
+    if any(values.get(species) == 0 for species in reactants):
+        return None
+    if any(values.get(species) == 1 for species in inhibitors):
+        return None
+    if activators and all(values.get(species) == 0 for species in activators):
+        return None
+    # satisfied activators are dropped by role, inhibitors may be the same species
+    satisfied = any(values.get(species) == 1 for species in activators)
+    if not satisfied and not any(
+        species in values for species in reactants + activators + inhibitors
+    ):
+        return trans
+    modifiers = []
+    for modtype, modifier in trans.modifiers:
+        if modtype == AND_GATE:
+            modifier = ",".join(mod for mod in modifier.split(",") if mod not in values)
+        elif satisfied and modtype not in INHIBITION:
+            continue
+        if modifier and modifier not in values:
+            modifiers.append((modtype, modifier))
+    return trans._replace(
+        reactants=tuple(reac for reac in trans.reactants if reac not in values),
+        modifiers=tuple(modifiers),
+    )
+
+
+def merge_copies(info, keep: AbstractSet[str], removed: Dict[str, Reduction]) -> bool:
+    """Merge species that just copy another one into it."""
+    changed = False
+    for species, data in list(info.items()):
+        if species in keep or len(data.transitions) != 1:
+            continue
+        reactants, activators, inhibitors = reaction_roles(
+            data.transitions[0], info.keys()
+        )
+        if activators or inhibitors or len(reactants) != 1:
+            continue
+        (source,) = reactants
+        if source == species:
+            continue
+        logger.debug("merging {sp} into {src}", sp=species, src=source)
+        removed[species] = Reduction(data.name, None, source)
+        del info[species]
+        known = info.keys() | {species}
+        replaced = {}  # type: Dict[int, Transition]
+        for other in info.values():
+            transitions = []
+            for trans in other.transitions:
+                if id(trans) not in replaced:
+                    replaced[id(trans)] = merge_transition(
+                        trans, species, source, known
+                    )
+                transitions.append(replaced[id(trans)])
+            other.transitions = transitions
+        changed = True
+    return changed
+
+
+def merge_transition(
+    trans: Transition, species: str, source: str, known: AbstractSet[str]
+) -> Transition:
+    """Return trans with species replaced by source.
+
+    When an activator becomes one of the needed species, the other activators
+    do not matter anymore, since a & (a | b) = a, and are all dropped.
+    """
+
+    def replace(item):
+        if item == species:
+            return source, (False, True)
+        return item, (False, False)
+
+    new = replace_in_transition(trans, replace)
+    if new is trans or trans.type in NEGATIVE:
+        return new
+    reactants, activators, _inhibitors = reaction_roles(trans, known)
+    needed = {replace(reac)[0] for reac in reactants}
+    if not any(replace(activator)[0] in needed for activator in activators):
+        return new
+    return new._replace(
+        modifiers=tuple(
+            (modtype, modifier)
+            for modtype, modifier in new.modifiers
+            if modtype in INHIBITION or modtype == AND_GATE
+        )
+    )
+
+
+def remove_unused(info, keep: AbstractSet[str], removed: Dict[str, Reduction]) -> bool:
+    """Remove species that nothing uses, except those in keep.
+
+    Species used only by themselves are kept, since they may be fixed at
+    different levels, or at none.
+    """
+    changed = False
+    while True:
+        used = set()
+        for data in info.values():
+            for trans in data.transitions:
+                for roles in reaction_roles(trans, info.keys()):
+                    used.update(roles)
+        unused = [
+            species for species in info if species not in used and species not in keep
+        ]
+        if not unused:
+            return changed
+        for species in unused:
+            logger.debug("removing unused {sp}", sp=species)
+            removed[species] = Reduction(info[species].name, None, None)
+            del info[species]
+        changed = True
+
+
+def write_reduction(filename: str, removed: Mapping[str, Reduction]):
+    """Write what became of each removed species as CSV.
+
+    Columns are the id, name, constant value and the species it was merged
+    into of each removed species.
+    """
+    with open_file(filename, "wt", newline="") as f:
+        writer = csv.writer(f)
+        for species, reduction in removed.items():
+            writer.writerow(
+                [
+                    species,
+                    reduction.name,
+                    "" if reduction.value is None else reduction.value,
+                    reduction.into or "",
+                ]
+            )
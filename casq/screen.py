@@ -0,0 +1,260 @@
+"""Screen knockouts and knock-ins of a model in parallel.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Mapping
+
+from loguru import logger  # type: ignore
+
+from .fixpoints import logic_fixed_points, read_fixed
+from .logic import model_logic
+from .readCD import read_celldesigner
+from .simplify import simplify_model
+from .simulate import async_chunk, phenotypes
+from .utils import open_file
+
+READOUTS = ("fixpoints", "reach")
+# the model being screened, sent once to each worker
+MODEL = {}  # type: Dict[str, object]
+
+
+def perturbations(targets: List[str], pairs: bool) -> Iterator[Dict[str, int]]:
+    """Yield all knockouts and knock-ins of targets, then of pairs of them."""
+    for species in targets:
+        for level in (0, 1):
+            yield {species: level}
+    if pairs:
+        for first, second in itertools.combinations(targets, 2):
+            for levels in itertools.product((0, 1), repeat=2):
+                yield dict(zip((first, second), levels))
+
+
+def set_model(model: Dict[str, object]):
+    """Keep the model screened by this worker."""
+    MODEL.update(model)
+
+
+def fixpoints_readout(fixed: Mapping[str, int]) -> List[str]:
+    """Return the number of fixed points and the level of observed species.
+
+    Levels are * when they differ between fixed points, and empty when there
+    are none.
+    """
+    result = logic_fixed_points(MODEL["logic"], MODEL["species"], fixed, MODEL["limit"])
+    levels = []
+    for species in MODEL["observed"]:
+        values = {cube.get(species, "*") for cube in result.cubes}
+        levels.append(str(values.pop()) if len(values) == 1 else "*" if values else "")
+    count = str(result.count) if result.complete else f">={result.count}"
+    return [count] + levels
+
+
+def reach_readout(fixed: Mapping[str, int]) -> List[str]:
+    """Return the fraction of asynchronous trajectories activating observed species.
+
+    Trajectories start with observed species inactive, and all perturbations
+    use the same seed, hence the same initial states.
+    """
+    initial = dict.fromkeys(MODEL["observed"], 0)
+    initial.update(fixed)
+    logic = {
+        species: function
+        for species, function in MODEL["logic"].items()
+        if species not in fixed
+    }
+    _active, reached = async_chunk(
+        MODEL["species"],
+        logic,
+        MODEL["observed"],
+        MODEL["runs"],
+        MODEL["steps"],
+        MODEL["steps"],
+        MODEL["seed"],
+        initial,
+    )
+    return [f"{count / MODEL['runs']:.4f}" for count in reached]
+
+
+def evaluate(perturbation: Dict[str, int]) -> List[str]:
+    """Return the readout of the model where perturbation is applied."""
+    fixed = dict(MODEL["fixed"])
+    fixed.update(perturbation)
+    if MODEL["readout"] == "reach":
+        return reach_readout(fixed)
+    return fixpoints_readout(fixed)
+
+
+def screened_model(
+    info,
+    fixed: Mapping[str, int],
+    readout: str = "fixpoints",
+    limit: int = 1000,
+    runs: int = 1000,
+    steps: int = 1000,
+    seed: int = 0,
+) -> Dict[str, object]:
+    """Return what workers need to evaluate the variants of a simplified model."""
+    return {
+        "species": list(info.keys()),
+        "logic": model_logic(info),
+        "observed": phenotypes(info),
+        "fixed": dict(fixed),
+        "readout": readout,
+        "limit": limit,
+        "runs": runs,
+        "steps": steps,
+        "seed": str(seed),
+    }
+
+
+def screen(
+    model: Dict[str, object], variants: List[Dict[str, int]], jobs: int
+) -> Iterator[List[str]]:
+    """Yield the readout of each variant of model, computed in parallel."""
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=set_model, initargs=(model,)
+    ) as executor:
+        chunksize = max(1, len(variants) // (4 * jobs))
+        yield from executor.map(evaluate, variants, chunksize=chunksize)
+
+
+def main(argv: List[str]) -> int:
+    """Screen the perturbations given by the CLI arguments."""
+    parser = argparse.ArgumentParser(
+        prog="casq screen",
+        description="Evaluate all single, or pairwise, knockouts and knock-ins of a "
+        "CellDesigner map, parsed only once.",
+    )
+    parser.add_argument(
+        "-D", "--debug", action="store_true", help="Display a lot of debug information"
+    )
+    parser.add_argument(
+        "-f",
+        "--fixed",
+        type=argparse.FileType("r"),
+        help="A CSV file containing input values or knock-ins/knock-outs, "
+        "applied to all variants",
+    )
+    parser.add_argument(
+        "-t",
+        "--targets",
+        metavar="S,...",
+        type=lambda value: value.split(","),
+        help="Only perturb these species (defaults to all but phenotypes)",
+    )
+    parser.add_argument(
+        "-p", "--pairs", action="store_true", help="Also perturb all pairs of targets"
+    )
+    parser.add_argument(
+        "-R",
+        "--readout",
+        choices=READOUTS,
+        default="fixpoints",
+        help="Number of fixed points and level of phenotypes in them, or fraction "
+        "of asynchronous trajectories where phenotypes become active "
+        "(defaults to fixpoints)",
+    )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="With fixpoints, stop after N sets of fixed points (defaults to 1000)",
+    )
+    parser.add_argument(
+        "--runs",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="With reach, number of trajectories (defaults to 1000)",
+    )
+    parser.add_argument(
+        "--steps",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="With reach, length of trajectories (defaults to 1000)",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="With reach, random seed (defaults to 0)"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of variants evaluated at the same time (defaults to the number "
+        "of CPUs)",
+    )
+    parser.add_argument(
+        "infile", help="CellDesigner File, possibly compressed (.gz, .bz2, .xz or .zip)"
+    )
+    parser.add_argument(
+        "outfile",
+        nargs="?",
+        type=argparse.FileType("w"),
+        default=sys.stdout,
+        help="CSV file, one line per variant",
+    )
+    args = parser.parse_args(argv)
+    if not args.debug:
+        logger.disable("casq")
+    start = time.perf_counter()
+    with open_file(args.infile) as f:
+        info, _width, _height = read_celldesigner(f)
+    simplify_model(info, [], [])
+    fixed = read_fixed(args.fixed) if args.fixed else {}
+    model = screened_model(
+        info, fixed, args.readout, args.limit, args.runs, args.steps, args.seed
+    )
+    targets = args.targets or [
+        species
+        for species in info
+        if species not in fixed and species not in model["observed"]
+    ]
+    for species in list(fixed) + targets:
+        if species not in info:
+            print(f"Unknown '{species}' could not be perturbed.", file=sys.stderr)
+            return 1
+    variants = list(perturbations(targets, args.pairs))
+    writer = csv.writer(args.outfile)
+    first = ["fixed points"] if args.readout == "fixpoints" else []
+    writer.writerow(
+        ["perturbation", "names"]
+        + first
+        + [info[species].name for species in model["observed"]]
+    )
+    for variant, readout in zip(variants, screen(model, variants, max(1, args.jobs))):
+        ids = " ".join(f"{species}={level}" for species, level in variant.items())
+        names = " ".join(
+            f"{info[species].name}={level}" for species, level in variant.items()
+        )
+        writer.writerow([ids, names] + readout)
+    print(
+        f"{len(variants)} variants in {time.perf_counter() - start:.2f}s",
+        file=sys.stderr,
+    )
+    return 0
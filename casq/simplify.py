@@ -19,72 +19,84 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import collections
 from typing import cast  # noqa: F401
 
-import networkx as nx  # type: ignore
 from loguru import logger  # type: ignore
 
 from .readCD import Transition, add_rdf
 
 
-def simplify_model(info, upstream, downstream, names_as_ids: bool = False):
+def simplify_model(
+    info, upstream, downstream, names_as_ids: bool = False, max_depth=None
+):
     """Clean the model w.r.t. some active/inactive species."""
-    multispecies = delete_complexes_and_store_multispecies(info)
+    merged = {}  # type: Dict[str, str]
+    consumers = build_consumers(info)
+    multispecies = delete_complexes_and_store_multispecies(info, merged, consumers)
+    # transitions still use merged species until the final rewrite
+    consumers = build_consumers(info, merged)
     # pylint: disable=too-many-nested-blocks
     for key, value in multispecies.items():
         for val in value:
             # check that it does not appear in any other reaction than the
             # activation one
             logger.debug("looking at multispecies: {mul}", mul=val)
-            active = get_active(val, info)
+            active = get_active(val, consumers)
             if val not in info:
                 # val has been deleted just above
                 continue
             if active in value:
-                if not info[val]["transitions"]:
+                if not info[val].transitions:
                     # we know that active is a str here, since it is in value
-                    add_rdf(info, cast(str, active), info[val]["annotations"])
+                    add_rdf(info, cast(str, active), info[val].annotations)
                     logger.debug(
                         "deleting {val} [{active} is active for {key}]",
                         val=val,
                         active=active,
                         key=key,
                     )
+                    remove_consumer(consumers, val, info[val].transitions, merged)
                     del info[val]
-                elif len(info[active]["transitions"]) == 1:
-                    reac = info[active]["transitions"][0]
+                elif len(info[active].transitions) == 1:
+                    reac = info[active].transitions[0]
                     if (
                         reac.type == "TRANSPORT"
-                        and reac.modifiers == []
-                        and reac.reactants == [val]
+                        and reac.modifiers == ()
+                        and tuple(find_merged(merged, r) for r in reac.reactants)
+                        == (val,)
                     ):
-                        info[active]["transitions"] = info[val]["transitions"]
-                        add_rdf(info, cast(str, active), info[val]["annotations"])
+                        remove_consumer(
+                            consumers, active, info[active].transitions, merged
+                        )
+                        info[active].transitions = info[val].transitions
+                        add_consumer(consumers, active, info[val].transitions, merged)
+                        add_rdf(info, cast(str, active), info[val].annotations)
                         logger.debug(
                             "merging {val} into {active} in transport for {key}]",
                             val=val,
                             active=active,
                             key=key,
                         )
+                        remove_consumer(consumers, val, info[val].transitions, merged)
                         del info[val]
     fix_all_names(info)
-    if names_as_ids:
-        use_names_as_ids(info)
-    restrict_model(info, upstream, downstream)
+    renamed = use_names_as_ids(info) if names_as_ids else {}
+    replace_in_transitions(info, merged, renamed)
+    restrict_model(info, upstream, downstream, max_depth)
     handle_phenotypes(info)
 
 
 def handle_phenotypes(info):
     """Restructure all reactions targetting a phenotype as a single one."""
     for key, data in list(info.items()):
-        if data["type"] != "PHENOTYPE":
+        if data.type != "PHENOTYPE":
             continue
-        transitions = data["transitions"]
+        transitions = data.transitions
         modifiers = []
         new_transitions = []
         for t in transitions:
             if len(t.reactants) != 1:
                 logger.debug(
                     "ignoring non-unary reaction to phenotype {pheno}",
-                    pheno=data["name"],
+                    pheno=data.name,
                 )
                 new_transitions.append(t)
                 continue
@@ -93,20 +105,24 @@ def handle_phenotypes(info):
             else:
                 modifiers.append(("CATALYSIS", t.reactants[0]))
         new_transitions.append(
-            Transition("STATE_TRANSITION", [], modifiers, None, None)
+            Transition("STATE_TRANSITION", (), tuple(modifiers), None, None)
         )
-        info[key]["transitions"] = new_transitions
+        info[key].transitions = new_transitions
 
 
-def delete_complexes_and_store_multispecies(info):
+def delete_complexes_and_store_multispecies(info, merged, consumers=None):
     """Delete useless species and store multispecies.
 
     Useless species are ligand binding to a receptor, or otherwise unused
     proteins that bind to form a complex.
+    Merged species are recorded in merged, to be replaced in transitions by
+    replace_in_transitions. consumers, as built by build_consumers, is kept
+    up to date but ignores these merges.
     """
+    if consumers is None:
+        consumers = build_consumers(info)
     multispecies = {}  # type: Dict[str, List[str]]
     duplicate_nodes = {}
-    replacements = {}
     # we have to create the list since info will change during iteration
     for key, value in list(info.items()):
         if key.startswith("__"):
@@ -116,32 +132,34 @@ def delete_complexes_and_store_multispecies(info):
                 multispecies[key] = value
         # merge nodes that have the same reference species
         elif (
-            value["ref_species"] in duplicate_nodes
+            value.ref_species in duplicate_nodes
             and key in info
-            and duplicate_nodes[value["ref_species"]] in info
+            and duplicate_nodes[value.ref_species] in info
         ):
-            into = duplicate_nodes[value["ref_species"]]
+            into = duplicate_nodes[value.ref_species]
             logger.debug(
                 "merging {key} into {into} for {ref} ({name})",
                 key=key,
                 into=into,
-                ref=value["ref_species"],
-                name=value["name"],
+                ref=value.ref_species,
+                name=value.name,
             )
             # put our annotations with those of into
-            add_rdf(info, into, info[key]["annotations"])
+            add_rdf(info, into, info[key].annotations)
             # put our transitions with those of into
-            info[into]["transitions"].extend(info[key]["transitions"])
+            info[into].transitions.extend(info[key].transitions)
+            add_consumer(consumers, into, info[key].transitions)
             # replace key in other transitions with into
-            replacements[key] = into
+            merge(merged, key, into)
+            remove_consumer(consumers, key, info[key].transitions)
             del info[key]
         # delete receptors that only contribute to their complex
-        elif value["receptor"] and not value["transitions"]:
+        elif value.receptor and not value.transitions:
             logger.debug("{key} is a RECEPTOR (and an input)", key=key)
-            active = get_active(key, info)
+            active = get_active(key, consumers)
             if active and [
                 trans
-                for trans in info[active]["transitions"]
+                for trans in info[active].transitions
                 if key in trans.reactants and trans.type == "HETERODIMER_ASSOCIATION"
             ]:
                 logger.debug(
@@ -149,25 +167,26 @@ def delete_complexes_and_store_multispecies(info):
                     key=key,
                     active=active,
                 )
-                add_rdf(info, cast(str, active), info[key]["annotations"])
+                add_rdf(info, cast(str, active), info[key].annotations)
+                remove_consumer(consumers, key, info[key].transitions)
                 del info[key]
-        elif value["type"] == "COMPLEX":
-            for trans in value["transitions"]:
+        elif value.type == "COMPLEX":
+            for trans in value.transitions:
                 if trans.type == "HETERODIMER_ASSOCIATION":
                     if len(trans.reactants) != 2:
                         continue
                     [reac1, reac2] = trans.reactants
                     if reac1 not in info or reac2 not in info:
                         continue
-                    active1 = get_active(reac1, info)
-                    active2 = get_active(reac2, info)
+                    active1 = get_active(reac1, consumers)
+                    active2 = get_active(reac2, consumers)
                     if (
                         active1 == key
                         and active2 == key
-                        and not info[reac1]["receptor"]
-                        and not info[reac2]["receptor"]
-                        and not info[reac1]["transitions"]
-                        and not info[reac2]["transitions"]
+                        and not info[reac1].receptor
+                        and not info[reac2].receptor
+                        and not info[reac1].transitions
+                        and not info[reac2].transitions
                     ):
                         logger.debug(
                             "deleting {reac1} and {reac2} for complex {key}",
@@ -175,122 +194,211 @@ def delete_complexes_and_store_multispecies(info):
                             reac2=reac2,
                             key=key,
                         )
-                        add_rdf(info, key, info[reac1]["annotations"])
-                        add_rdf(info, key, info[reac2]["annotations"])
-
-                        info[key]["transitions"].extend(info[reac1]["transitions"])
-                        info[key]["transitions"].extend(info[reac2]["transitions"])
-                        if info[reac1]["ref_species"] in duplicate_nodes:
-                            duplicate_nodes[info[reac1]["ref_species"]] = key
-                        if info[reac2]["ref_species"] in duplicate_nodes:
-                            duplicate_nodes[info[reac2]["ref_species"]] = key
+                        add_rdf(info, key, info[reac1].annotations)
+                        add_rdf(info, key, info[reac2].annotations)
+
+                        for reac in (reac1, reac2):
+                            info[key].transitions.extend(info[reac].transitions)
+                            add_consumer(consumers, key, info[reac].transitions)
+                            remove_consumer(consumers, reac, info[reac].transitions)
+                        if info[reac1].ref_species in duplicate_nodes:
+                            duplicate_nodes[info[reac1].ref_species] = key
+                        if info[reac2].ref_species in duplicate_nodes:
+                            duplicate_nodes[info[reac2].ref_species] = key
                         del info[reac1]
                         del info[reac2]
-                        # info[key]["transitions"].remove(trans)
+                        # info[key].transitions.remove(trans)
         else:
-            duplicate_nodes[value["ref_species"]] = key
-    replace_in_transitions(info, replacements)
+            duplicate_nodes[value.ref_species] = key
     return multispecies
 
 
-def restrict_model(info, upstream, downstream):
-    """Only keep species upstream/downstream of some list of species."""
-    name_to_ids = {v["name"]: k for (k, v) in info.items()}
+def restrict_model(info, upstream, downstream, max_depth=None):
+    """Only keep species upstream/downstream of some list of species.
+
+    If max_depth is given, only species at most that many influences away
+    are kept.
+    """
+    name_to_ids = {v.name: k for (k, v) in info.items()}
     for name in upstream + downstream:
         if name not in name_to_ids:
             logger.error(name + " was not found, maybe it is ambiguous…")
 
     if upstream == [] and downstream == []:
         return
-    graph = nx.DiGraph()
+    successors = collections.defaultdict(set)  # type: Dict[str, Set[str]]
+    predecessors = collections.defaultdict(set)  # type: Dict[str, Set[str]]
     for species, data in info.items():
-        graph.add_node(species)
-        for trans in data["transitions"]:
-            for val in trans.reactants:
-                graph.add_edge(val, species)
-            for _modtype, modlist in trans.modifiers:
-                for val in modlist.split(","):
-                    graph.add_edge(val, species)
-    keep = set()
-    for dnname in downstream:
-        dn = name_to_ids[dnname]
-        keep |= {
-            elt for succl in nx.dfs_successors(graph, dn).values() for elt in succl
-        } | {dn}
-    ggraph = graph.reverse()
-    for upname in upstream:
-        up = name_to_ids[upname]
-        keep |= {
-            elt for succl in nx.dfs_successors(ggraph, up).values() for elt in succl
-        } | {up}
+        for trans in data.transitions:
+            for val in used_in(trans):
+                successors[val].add(species)
+                predecessors[species].add(val)
+    keep = reachable(
+        successors, [name_to_ids[name] for name in downstream], max_depth
+    ) | reachable(predecessors, [name_to_ids[name] for name in upstream], max_depth)
     for species in list(info.keys()):
         if species not in keep:
             del info[species]
 
 
-def replace_in_transitions(info, replacements):
-    """Change transitions in info to reflect replacements."""
-    for _species, data in info.items():
-        for trans in data["transitions"]:
-            for val in trans.reactants.copy():
-                if val in replacements:
-                    trans.reactants.append(replacements[val])
-                    trans.reactants.remove(val)
-            for modtype, mod_list in trans.modifiers.copy():
-                mlist = mod_list.split(",")
-                changed = False
-                for val in mlist:
-                    if val in replacements:
-                        mlist.append(replacements[val])
-                        mlist.remove(val)
-                        changed = True
-                if changed:
-                    trans.modifiers.append((modtype, ",".join(mlist)))
-                    trans.modifiers.remove((modtype, mod_list))
-        for old, new in replacements.items():
-            data["function"] = data["function"].replace(old, new)
-
-
-def get_active(val, info):
-    """Find who val activates."""
+def reachable(adjacency, sources, max_depth=None):
+    """Return the set of nodes reachable from sources in at most max_depth steps."""
+    seen = set(sources)
+    frontier = list(seen)
+    depth = 0
+    while frontier and (max_depth is None or depth < max_depth):
+        depth += 1
+        frontier = {
+            succ
+            for node in frontier
+            for succ in adjacency.get(node, ())
+            if succ not in seen
+        }
+        seen.update(frontier)
+    return seen
+
+
+def merge(merged, species, into):
+    """Record that species is merged into another one."""
+    species = find_merged(merged, species)
+    into = find_merged(merged, into)
+    if species != into:
+        merged[species] = into
+
+
+def find_merged(merged, species):
+    """Return the species that species has been merged into, or itself."""
+    root = species
+    while root in merged:
+        root = merged[root]
+    # compress the path for later lookups
+    while species != root:
+        merged[species], species = root, merged[species]
+    return root
+
+
+def replace_in_transitions(info, merged, renamed=None):
+    """Apply merges, and then renaming, to all transitions in a single pass."""
+    if renamed is None:
+        renamed = {}
+    replaced = {}  # type: Dict[int, Transition]
+
+    def replace(item):
+        new = find_merged(merged, item) if item in merged else item
+        return renamed.get(new, new), (new in renamed, item in merged)
+
+    for data in info.values():
+        transitions = []
+        for trans in data.transitions:
+            # transitions are shared by all products of a reaction
+            if id(trans) not in replaced:
+                replaced[id(trans)] = replace_in_transition(trans, replace)
+            transitions.append(replaced[id(trans)])
+        data.transitions = transitions
+
+
+def replace_in_transition(trans: Transition, replace) -> Transition:
+    """Return trans with its reactants and modifiers replaced.
+
+    replace returns the new item and whether it was renamed and merged. As
+    when merging and renaming were separate passes over mutable lists,
+    merged items move to the end, and then renamed ones.
+    """
+    reactants = [replace(reac) for reac in trans.reactants]
+    modifiers = []
+    for modtype, mod_list in trans.modifiers:
+        mods = [replace(mod) for mod in mod_list.split(",")]
+        moved = tuple(any(flags) for flags in zip(*(flags for _, flags in mods)))
+        modifiers.append(((modtype, ",".join(sorted_moved(mods))), moved))
+    if not any(any(flags) for _, flags in reactants + modifiers):
+        return trans
+    return trans._replace(
+        reactants=tuple(sorted_moved(reactants)),
+        modifiers=tuple(sorted_moved(modifiers)),
+    )
+
+
+def sorted_moved(items):
+    """Stably sort (item, moved) pairs, moved items last, and drop the flags."""
+    return [item for item, _ in sorted(items, key=lambda item: item[1])]
+
+
+def get_active(val, consumers):
+    """Find who val activates.
+
+    Return False if val is used in several transitions, even of one species.
+    """
     active = None
-    for species, data in info.items():
-        if species.startswith("csa") or species.startswith("sa"):
-            for trans in data["transitions"]:
-                if val in trans.reactants or val in (
-                    mod
-                    for _modtype, modifier_list in trans.modifiers
-                    for mod in modifier_list.split(",")
-                ):
-                    if active is None:
-                        active = species
-                        logger.debug("{val} activates {active}", val=val, active=active)
-                    else:
-                        logger.debug(
-                            "{val} also activates {active}", val=val, active=species
-                        )
-                        return False
+    for species, count in consumers.get(val, {}).items():
+        if active is None:
+            active = species
+            logger.debug("{val} activates {active}", val=val, active=active)
+            count -= 1
+        if count > 0:
+            logger.debug("{val} also activates {active}", val=val, active=species)
+            return False
     return active
 
 
+def build_consumers(info, merged=None):
+    """Map each species to the species whose transitions use it.
+
+    Consumers are counted once per transition, and only species with an alias
+    id are consumers. Used species are replaced by those they are merged into.
+    """
+    consumers = {}  # type: Dict[str, Dict[str, int]]
+    for species, data in info.items():
+        if not species.startswith("__"):
+            add_consumer(consumers, species, data.transitions, merged)
+    return consumers
+
+
+def used_in(trans, merged=None):
+    """Return the set of species used as reactants or modifiers in trans."""
+    used = set(trans.reactants)
+    for _modtype, modifier_list in trans.modifiers:
+        used.update(modifier_list.split(","))
+    if merged:
+        return {find_merged(merged, val) for val in used}
+    return used
+
+
+def add_consumer(consumers, species, transitions, merged=None):
+    """Record that species now uses everything used in transitions."""
+    if not (species.startswith("csa") or species.startswith("sa")):
+        return
+    for trans in transitions:
+        for val in used_in(trans, merged):
+            counts = consumers.setdefault(val, {})
+            counts[species] = counts.get(species, 0) + 1
+
+
+def remove_consumer(consumers, species, transitions, merged=None):
+    """Record that species does not use what is used in transitions anymore.
+
+    transitions must be all those of species.
+    """
+    for trans in transitions:
+        for val in used_in(trans, merged):
+            consumers.get(val, {}).pop(species, None)
+
+
 def fix_all_names(info):
     """Use more descriptive names."""
-    count_names = collections.Counter(value["name"] for value in info.values())
-    ambiguous_name = {
-        key: count_names[value["name"]] > 1 for key, value in info.items()
-    }
+    count_names = collections.Counter(value.name for value in info.values())
+    ambiguous_name = {key: count_names[value.name] > 1 for key, value in info.items()}
     namedict = {}
     for species, data in info.items():
-        name = fix_name(data["name"], ambiguous_name[species], data["compartment"])
-        activity = data["activity"]
+        name = fix_name(data.name, ambiguous_name[species], data.compartment)
+        activity = data.activity
         if ambiguous_name[species]:
             if name in namedict:
                 other_id, other_activity = namedict[name]
                 if activity == "active" and (name + "_active") not in namedict:
                     name = name + "_active"
                 elif other_activity == "active" and (name + "_active") not in namedict:
-                    info[other_id]["name"] = name + "_active"
-                    info[other_id]["function"] = name + "_active"
+                    info[other_id].name = name + "_active"
+                    info[other_id].function = name + "_active"
                 else:
                     newname = name
                     tag = 0
@@ -299,8 +407,8 @@ def fix_all_names(info):
                         newname = name + "_" + str(tag)
                     name = newname
             namedict[name] = (species, activity)
-        data["name"] = name
-        data["function"] = name
+        data.name = name
+        data.function = name
 
 
 def fix_name(name: str, ambiguous: bool, compartment: str):
@@ -321,17 +429,21 @@ def fix_name(name: str, ambiguous: bool, compartment: str):
 
 
 def use_names_as_ids(info):
-    """Replace all ids with names."""
+    """Replace all ids with names.
+
+    Return the renaming, to be applied to transitions by replace_in_transitions.
+    """
     newinfo = {}
     replacements = {}
     for key, data in info.items():
-        oname = data["name"]
+        oname = data.name
         name = oname.replace(" ", "_")
         name = "".join(c for c in name if c.isalnum() or c == "_")
         newinfo[name] = data
-        newinfo[name]["name"] = name
+        newinfo[name].name = name
+        newinfo[name].function = name
         replacements[oname] = name
         replacements[key] = name
     info.clear()
     info.update(newinfo)
-    replace_in_transitions(info, replacements)
+    return replacements
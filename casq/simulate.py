@@ -0,0 +1,297 @@
+"""Bit-parallel simulation of the Boolean models we derive.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import array
+import collections
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Mapping, Optional
+
+from .logic import And, Not, Var, model_logic
+
+try:
+    import numpy  # type: ignore
+
+    NUMPY = True
+except ImportError:  # pragma: no cover
+    numpy = None
+    NUMPY = False
+
+# update functions, as (index of species, function of values and mask) pairs
+Model = collections.namedtuple("Model", ["species", "index", "updates"])
+# many states at once, bit i of each value being the species in state i
+Packed = collections.namedtuple("Packed", ["values", "mask", "count"])
+# frequency of activity of observed species at the sampled times, and fraction
+# of trajectories where they were active at least once
+Ensemble = collections.namedtuple("Ensemble", ["times", "frequencies", "reached"])
+# trajectories simulated together, each chunk having its own random generator
+CHUNK = 4096
+
+
+def compile_model(info) -> Model:
+    """Compile the Boolean function of each species of a simplified model.
+
+    Species without a function are inputs and keep their value.
+    """
+    return compile_logic(list(info.keys()), model_logic(info))
+
+
+def compile_logic(species: List[str], logic: Mapping) -> Model:
+    """Compile the functions of logic, over the given species."""
+    index = {name: i for i, name in enumerate(species)}
+    updates = [
+        (index[name], compile_function(function, index))
+        for name, function in logic.items()
+    ]
+    return Model(species, index, updates)
+
+
+def compile_function(function, index: Mapping[str, int]) -> Callable:
+    """Turn function into Python bitwise operations over packed values."""
+    # the source only uses indices, never names coming from the model
+    return eval("lambda x, m: " + bitwise(function, index))  # pylint: disable=eval-used
+
+
+def bitwise(function, index: Mapping[str, int]) -> str:
+    """Return the Python expression of function, m being all ones."""
+    if isinstance(function, Var):
+        return f"x[{index[function.species]}]"
+    if isinstance(function, Not):
+        return f"(m ^ x[{index[function.species]}])"
+    if not function.args:
+        return "m" if isinstance(function, And) else "(m ^ m)"
+    operator = " & " if isinstance(function, And) else " | "
+    return "(" + operator.join(bitwise(arg, index) for arg in function.args) + ")"
+
+
+def from_bits(bits: List[int], count: int, use_numpy: bool) -> Packed:
+    """Pack the values given as one integer per species."""
+    mask = (1 << count) - 1
+    if not use_numpy:
+        return Packed(bits, mask, count)
+    words = (count + 63) // 64
+
+    def to_words(value: int):
+        """Return value as an array of 64-bit words."""
+        return numpy.frombuffer(value.to_bytes(8 * words, "little"), dtype="<u8")
+
+    return Packed([to_words(value) for value in bits], to_words(mask), count)
+
+
+def to_bits(value) -> int:
+    """Return a packed value as an integer."""
+    if isinstance(value, int):
+        return value
+    return int.from_bytes(value.astype("<u8").tobytes(), "little")
+
+
+def pack_states(
+    model: Model, states: Iterable[Mapping[str, int]], use_numpy: bool = NUMPY
+) -> Packed:
+    """Pack states, given as species to level mappings, missing species being 0."""
+    bits = [0] * len(model.species)
+    count = 0
+    for count, state in enumerate(states, 1):
+        bit = 1 << (count - 1)
+        for species, level in state.items():
+            if level:
+                bits[model.index[species]] |= bit
+    return from_bits(bits, count, use_numpy)
+
+
+def random_states(
+    model: Model, count: int, seed: Optional[int] = None, use_numpy: bool = NUMPY
+) -> Packed:
+    """Pack count uniformly random states, the same for a given seed."""
+    rng = random.Random(seed)
+    bits = [rng.getrandbits(count) for _ in model.species]
+    return from_bits(bits, count, use_numpy)
+
+
+def unpack_states(model: Model, packed: Packed) -> List[Dict[str, int]]:
+    """Return packed as a list of species to level mappings."""
+    bits = [to_bits(value) for value in packed.values]
+    return [
+        {species: (bits[i] >> state) & 1 for i, species in enumerate(model.species)}
+        for state in range(packed.count)
+    ]
+
+
+def step(model: Model, packed: Packed) -> Packed:
+    """Update all species of all states synchronously."""
+    values = list(packed.values)
+    for i, update in model.updates:
+        values[i] = update(packed.values, packed.mask)
+    return packed._replace(values=values)
+
+
+def simulate(model: Model, packed: Packed, steps: int) -> Packed:
+    """Return all states after steps synchronous updates."""
+    for _ in range(steps):
+        packed = step(model, packed)
+    return packed
+
+
+def activity(model: Model, packed: Packed) -> Dict[str, float]:
+    """Return the fraction of states where each species is active."""
+    return {
+        species: bin(to_bits(value)).count("1") / packed.count
+        for species, value in zip(model.species, packed.values)
+    }
+
+
+def choose_updates(
+    rng: random.Random, count: int, mask: int, choices: int
+) -> List[int]:
+    """Draw uniformly one of choices updates for each state of mask.
+
+    Return, for each update, the bits of the states that chose it.
+    """
+    masks = [0] * choices
+    if not choices:
+        return masks
+    depth = (choices - 1).bit_length()
+    # each state gets depth random bits, one level of a binary tree at a time,
+    # and draws again when falling beyond choices, until drawing each of the
+    # remaining states separately is cheaper than going through the tree
+    full = mask
+    while bin(mask).count("1") > 2 * choices:
+        blocks = [mask]
+        mask = 0
+        for level in reversed(range(depth)):
+            plane = rng.getrandbits(count)
+            other = full ^ plane
+            blocks = [half for bits in blocks for half in (bits & other, bits & plane)]
+            used = -(-choices >> level)
+            for bits in blocks[used:]:
+                mask |= bits
+            del blocks[used:]
+        for i, bits in enumerate(blocks):
+            masks[i] |= bits
+    while mask:
+        low = mask & -mask
+        masks[rng.randrange(choices)] |= low
+        mask ^= low
+    return masks
+
+
+def async_step(model: Model, packed: Packed, rng: random.Random) -> Packed:
+    """Update a single random species in each state.
+
+    Only states packed as integers are supported.
+    """
+    values = list(packed.values)
+    masks = choose_updates(rng, packed.count, packed.mask, len(model.updates))
+    for (i, update), chosen in zip(model.updates, masks):
+        if chosen:
+            values[i] ^= (values[i] ^ update(packed.values, packed.mask)) & chosen
+    return packed._replace(values=values)
+
+
+def phenotypes(info) -> List[str]:
+    """Return the phenotype species of a model."""
+    return [key for key, data in info.items() if data.type == "PHENOTYPE"]
+
+
+def async_chunk(
+    species: List[str],
+    logic: Mapping,
+    observed: List[str],
+    count: int,
+    steps: int,
+    every: int,
+    seed: str,
+    initial: Mapping[str, int],
+):
+    """Simulate count trajectories from random states, fixing initial ones.
+
+    Return, for each observed species, the number of active states at each
+    sampled time and the number of trajectories where it was ever active.
+    """
+    model = compile_logic(species, logic)
+    rng = random.Random(seed)
+    bits = [rng.getrandbits(count) for _ in species]
+    packed = from_bits(bits, count, False)
+    for name, level in initial.items():
+        packed.values[model.index[name]] = packed.mask if level else 0
+    indices = [model.index[name] for name in observed]
+    active = [array.array("q") for _ in observed]
+    reached = [0] * len(observed)
+    for time in range(steps + 1):
+        if time:
+            packed = async_step(model, packed, rng)
+        for k, i in enumerate(indices):
+            reached[k] |= packed.values[i]
+            if time % every == 0:
+                active[k].append(bin(packed.values[i]).count("1"))
+    return active, [bin(value).count("1") for value in reached]
+
+
+def async_ensemble(
+    info,
+    runs: int,
+    steps: int,
+    every: int = 1,
+    seed: int = 0,
+    initial: Optional[Mapping[str, int]] = None,
+    observed: Optional[List[str]] = None,
+    jobs: Optional[int] = None,
+) -> Ensemble:
+    """Simulate runs asynchronous trajectories of steps random updates.
+
+    Trajectories start from uniformly random states, except for the species
+    levels given in initial, and are split in chunks simulated in parallel.
+    Each chunk has its own random generator, so that results only depend on
+    seed, not on the number of jobs.
+    Observed species default to the phenotypes, their frequencies being given
+    as arrays, every steps.
+    """
+    if observed is None:
+        observed = phenotypes(info)
+    species = list(info.keys())
+    logic = model_logic(info)
+    sizes = [min(CHUNK, runs - start) for start in range(0, runs, CHUNK)]
+    times = list(range(0, steps + 1, every))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                async_chunk,
+                species,
+                logic,
+                observed,
+                size,
+                steps,
+                every,
+                f"{seed}:{n}",
+                initial or {},
+            )
+            for n, size in enumerate(sizes)
+        ]
+        results = [future.result() for future in futures]
+    frequencies = {}
+    reached = {}
+    for k, name in enumerate(observed):
+        frequencies[name] = array.array(
+            "d",
+            (
+                sum(active[k][t] for active, _ in results) / runs
+                for t in range(len(times))
+            ),
+        )
+        reached[name] = sum(ever[k] for _, ever in results) / runs
+    return Ensemble(times, frequencies, reached)
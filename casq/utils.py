@@ -15,30 +15,54 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
-import json
-import subprocess
-import time
 
+import bz2
+import gzip
+import io
+import lzma
+import os.path
+import zipfile
+from typing import IO, Optional, Tuple
 
-def validate(filename: str) -> str:
-    """Validate an SBML file using the online validator API.
+COMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
 
-    Unit consistency verification is off
+
+def split_compression(filename: str) -> Tuple[str, str]:
+    """Split filename into its base and its compression extension, if any."""
+    base, ext = os.path.splitext(filename)
+    if ext.lower() in COMPRESSORS or ext.lower() == ".zip":
+        return base, ext
+    return filename, ""
+
+
+def open_file(filename: str, mode: str = "r", newline: Optional[str] = None) -> IO:
+    """Open filename, (de)compressing it on the fly according to its extension.
+
+    .gz, .bz2 and .xz files can be read and written, .zip archives can only be
+    read, in which case their first XML file (or first file) is used.
+    Text modes always use UTF-8.
     """
-    url = "https://sbml.org/validator_servlet/ValidatorServlet"
-    command = "curl -s -F file=@{filename} -F output=json -F offcheck=u {url}".format(
-        filename=filename, url=url
-    )
-    try:
-        process = subprocess.run(command.split(), stdout=subprocess.PIPE, check=True)
-    except subprocess.CalledProcessError as e:
-        # failure to receive data
-        if e.returncode == 56:
-            time.sleep(2)
-            return validate(filename)
-        return e.output
-    result = json.loads(process.stdout.decode("utf-8"))["validation-results"]
-    if "no-errors" in result:
-        return "OK"
-    # else:
-    return json.dumps(result["problem"], indent=2)
+    ext = split_compression(filename)[1].lower()
+    binary = mode.endswith("b")
+    if ext == ".zip":
+        if not mode.startswith("r"):
+            raise ValueError(f"Cannot write zip archive {filename}, use .gz instead")
+        with zipfile.ZipFile(filename) as archive:
+            members = [member for member in archive.infolist() if not member.is_dir()]
+            if not members:
+                raise ValueError(f"Empty zip archive {filename}")
+            xml_members = [m for m in members if m.filename.lower().endswith(".xml")]
+            # the member stays readable after the archive itself is closed
+            stream = archive.open((xml_members or members)[0])
+        stream.name = filename
+    elif ext in COMPRESSORS:
+        stream = COMPRESSORS[ext](filename, mode[0] + "b")
+        if not hasattr(stream, "name"):
+            stream.name = filename
+    elif binary:
+        return open(filename, mode)
+    else:
+        return open(filename, mode, encoding="utf-8", newline=newline)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, encoding="utf-8", newline=newline)
@@ -0,0 +1,247 @@
+"""Offline structural validation of the SBML-qual files we produce.
+
+Copyright (C) 2019, Sylvain.Soliman@inria.fr
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from .backend import parse
+from .readCD import NS
+from .utils import open_file
+
+SBML = NS["sbml3"]
+QUAL = NS["qual"]
+LAYOUT = NS["layout"]
+MATHML = NS["mathml"]
+NAMESPACES = {"sbml": SBML, "qual": QUAL, "layout": LAYOUT, "mathml": MATHML}
+SID = re.compile("[A-Za-z_][A-Za-z0-9_]*$")
+INPUT_SIGNS = ("positive", "negative", "dual", "unknown")
+INPUT_EFFECTS = ("none", "consumption")
+OUTPUT_EFFECTS = ("production", "assignmentLevel")
+
+
+def qual(name: str) -> str:
+    """Return the qualified name of a qual element or attribute."""
+    return f"{{{QUAL}}}{name}"
+
+
+def level(elem, attribute: str, problems: List[str], what: str) -> Optional[int]:
+    """Return the non-negative integer attribute of elem, if any."""
+    value = elem.get(qual(attribute))
+    if value is None:
+        return None
+    if not value.isdigit():
+        problems.append(f"{what}: {attribute} '{value}' is not a non-negative integer")
+        return None
+    return int(value)
+
+
+def validate_qual(filename: str) -> List[str]:
+    """Return the problems found in an SBML-qual file, none if it is valid.
+
+    This checks the structure CaSQ relies on: unique identifiers, references
+    between species, transitions, MathML and layout, and consistent levels.
+    It is no replacement for a complete SBML validator.
+    """
+    try:
+        with open_file(filename, "rb") as f:
+            root = parse(f)
+    except Exception as e:  # pylint: disable=broad-except
+        return [f"not a readable XML file: {e}"]
+    if root.tag != f"{{{SBML}}}sbml":
+        return ["root element is not SBML level 3 version 1"]
+    problems = []  # type: List[str]
+    for attribute in (qual("required"), f"{{{LAYOUT}}}required"):
+        if root.get(attribute) is None:
+            problems.append(f"sbml: missing required attribute {attribute}")
+    models = root.findall("sbml:model", NAMESPACES)
+    if len(models) != 1:
+        return problems + [f"sbml: {len(models)} model elements instead of 1"]
+    model = models[0]
+    ids = {}  # type: Dict[str, str]
+
+    def declare(sid: Optional[str], what: str):
+        """Record a new SId."""
+        if sid is None:
+            problems.append(f"{what}: missing id")
+            return
+        if not SID.match(sid):
+            problems.append(f"{what}: '{sid}' is not a valid SId")
+        if sid in ids:
+            problems.append(f"{what}: id '{sid}' already used by {ids[sid]}")
+        else:
+            ids[sid] = what
+
+    declare(model.get("id"), "model")
+    compartments = set()
+    for compartment in model.iterfind(
+        "sbml:listOfCompartments/sbml:compartment", NAMESPACES
+    ):
+        declare(compartment.get("id"), "compartment")
+        compartments.add(compartment.get("id"))
+    max_levels = {}  # type: Dict[str, Optional[int]]
+    constants = {}  # type: Dict[str, bool]
+    for species in model.iterfind(
+        "qual:listOfQualitativeSpecies/qual:qualitativeSpecies", NAMESPACES
+    ):
+        sid = species.get(qual("id"))
+        what = f"species {sid}"
+        declare(sid, what)
+        if species.get(qual("compartment")) not in compartments:
+            problems.append(
+                f"{what}: unknown compartment '{species.get(qual('compartment'))}'"
+            )
+        constant = species.get(qual("constant"))
+        if constant not in ("true", "false"):
+            problems.append(f"{what}: constant must be true or false")
+        max_level = level(species, "maxLevel", problems, what)
+        initial_level = level(species, "initialLevel", problems, what)
+        if None not in (max_level, initial_level) and initial_level > max_level:
+            problems.append(f"{what}: initialLevel is above maxLevel")
+        max_levels[sid] = max_level
+        constants[sid] = constant == "true"
+    assigned = {}  # type: Dict[str, str]
+    for transition in model.iterfind(
+        "qual:listOfTransitions/qual:transition", NAMESPACES
+    ):
+        tid = transition.get(qual("id"))
+        what = f"transition {tid}"
+        declare(tid, what)
+        inputs = set()
+        for inp in transition.iterfind("qual:listOfInputs/qual:input", NAMESPACES):
+            declare(inp.get(qual("id")), f"input of {what}")
+            sid = inp.get(qual("qualitativeSpecies"))
+            if sid not in max_levels:
+                problems.append(f"{what}: input of unknown species '{sid}'")
+            inputs.add(sid)
+            if inp.get(qual("sign"), "unknown") not in INPUT_SIGNS:
+                problems.append(f"{what}: input {sid} has an invalid sign")
+            if inp.get(qual("transitionEffect")) not in INPUT_EFFECTS:
+                problems.append(f"{what}: input {sid} has an invalid transitionEffect")
+        outputs = transition.findall("qual:listOfOutputs/qual:output", NAMESPACES)
+        if not outputs:
+            problems.append(f"{what}: no output")
+        output_levels = []
+        for out in outputs:
+            declare(out.get(qual("id")), f"output of {what}")
+            sid = out.get(qual("qualitativeSpecies"))
+            effect = out.get(qual("transitionEffect"))
+            if sid not in max_levels:
+                problems.append(f"{what}: output of unknown species '{sid}'")
+                continue
+            output_levels.append(max_levels[sid])
+            if constants[sid]:
+                problems.append(f"{what}: output {sid} is constant")
+            if effect not in OUTPUT_EFFECTS:
+                problems.append(f"{what}: output {sid} has an invalid transitionEffect")
+            elif effect == "assignmentLevel":
+                if sid in assigned:
+                    problems.append(
+                        f"{what}: output {sid} is already assigned by {assigned[sid]}"
+                    )
+                assigned[sid] = what
+        defaults = transition.findall(
+            "qual:listOfFunctionTerms/qual:defaultTerm", NAMESPACES
+        )
+        if len(defaults) != 1:
+            problems.append(f"{what}: {len(defaults)} default terms instead of 1")
+        terms = transition.findall(
+            "qual:listOfFunctionTerms/qual:functionTerm", NAMESPACES
+        )
+        for term in defaults + terms:
+            result = level(term, "resultLevel", problems, what)
+            if result is None:
+                problems.append(f"{what}: function term without resultLevel")
+            elif any(top is not None and result > top for top in output_levels):
+                problems.append(
+                    f"{what}: resultLevel {result} is above an output maxLevel"
+                )
+        for term in terms:
+            math = term.find("mathml:math", NAMESPACES)
+            if math is None or len(math) != 1:
+                problems.append(
+                    f"{what}: function term without a single MathML expression"
+                )
+                continue
+            for ci in math.iter(f"{{{MATHML}}}ci"):
+                name = (ci.text or "").strip()
+                if name not in inputs:
+                    problems.append(
+                        f"{what}: MathML uses '{name}' which is not an input"
+                    )
+    layout_ids = set()
+    for glyph in model.iterfind(
+        "layout:listOfLayouts/layout:layout/layout:listOfAdditionalGraphicalObjects/*",
+        NAMESPACES,
+    ):
+        gid = glyph.get(f"{{{LAYOUT}}}id")
+        if gid is None or gid in layout_ids:
+            problems.append(f"glyph {gid}: missing or duplicate layout id")
+        layout_ids.add(gid)
+        reference = glyph.get(f"{{{LAYOUT}}}reference")
+        if reference is not None and reference not in ids:
+            problems.append(f"glyph {gid}: reference to unknown '{reference}'")
+        if glyph.find("layout:boundingBox", NAMESPACES) is None:
+            problems.append(f"glyph {gid}: no bounding box")
+    return problems
+
+
+def validate(filename: str) -> str:
+    """Validate an SBML-qual file, returning OK or the problems found."""
+    problems = validate_qual(filename)
+    if not problems:
+        return "OK"
+    return "\n".join(problems)
+
+
+def validate_files(
+    filenames: List[str], jobs: Optional[int] = None
+) -> Dict[str, List[str]]:
+    """Validate many files in parallel, returning the problems of each one."""
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(filenames, executor.map(validate_qual, filenames)))
+
+
+def main(argv: List[str]) -> int:
+    """Validate the files given on the command-line."""
+    parser = argparse.ArgumentParser(
+        prog="casq validate",
+        description="Check SBML-qual files produced by CaSQ, without network access.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files checked at the same time (defaults to the number of CPUs)",
+    )
+    parser.add_argument("files", nargs="+", help="SBML-qual files, possibly compressed")
+    args = parser.parse_args(argv)
+    invalid = 0
+    for filename, problems in validate_files(args.files, max(1, args.jobs)).items():
+        if problems:
+            invalid += 1
+            for problem in problems:
+                print(f"{filename}: {problem}", file=sys.stderr)
+        else:
+            print(f"{filename}: OK")
+    return 1 if invalid else 0
@@ -17,18 +17,24 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import csv
+import io
 import xml.etree.ElementTree as etree
-from itertools import chain, repeat
-from typing import IO, Dict, List, Optional, Tuple  # noqa: F401
+from contextlib import contextmanager
+from itertools import chain, count
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple  # noqa: F401
+from xml.sax.saxutils import escape
 
-import networkx as nx  # type: ignore
 from loguru import logger  # type: ignore
 
 from . import version
+from .logic import INHIBITION, NEGATIVE, model_logic, to_ginsim, to_mathml
 from .readCD import NS, Transition, add_rdf
+from .simplify import find_merged, merge
+from .utils import open_file, split_compression
 
-INHIBITION = ("INHIBITION", "UNKNOWN_INHIBITION")
-NEGATIVE = ("INHIBITION", "NEGATIVE_INFLUENCE", "UNKNOWN_INHIBITION")
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+# escaped in attribute values, besides &, < and >, as ElementTree does
+ATTRIBUTE_ENTITIES = {'"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#09;"}
 
 
 def write_qual(
@@ -39,98 +45,255 @@ def write_qual(
     remove: int = 0,
     sif: bool = False,
     fixed: Optional[IO] = None,
+    logic: Optional[Dict[str, object]] = None,
 ):
     # pylint: disable=too-many-arguments, too-many-locals
-    """Write the SBML qual with layout file for our model."""
+    """Write the SBML qual with layout file for our model.
+
+    logic defaults to the model_logic of info. Fixed species lose their
+    transitions, and with them their function, but nothing else changes.
+    """
     for name, space in NS.items():
         etree.register_namespace(name, space)
-    root = etree.Element(
-        "sbml",
-        {
-            "level": "3",
-            "version": "1",
-            "layout:required": "false",
-            "xmlns": NS["sbml3"],
-            "qual:required": "true",
-            "xmlns:layout": NS["layout"],
-            "xmlns:qual": NS["qual"],
-        },
-    )
-    model = etree.SubElement(root, "model", id="model_id")
-    notes = etree.SubElement(model, "notes")
-    html = etree.SubElement(notes, "html", xmlns=NS["xhtml"])
-    body = etree.SubElement(html, "body")
-    p = etree.SubElement(body, "p")
-    p.text = "Created by CaSQ " + version
-    clist = etree.SubElement(model, "listOfCompartments")
-    etree.SubElement(clist, "compartment", constant="true", id="comp1")
-    llist = etree.SubElement(model, "layout:listOfLayouts")
-    layout = etree.SubElement(llist, "layout:layout", id="layout1")
-    etree.SubElement(layout, "layout:dimensions", width=width, height=height)
-    qlist = etree.SubElement(model, "qual:listOfQualitativeSpecies")
-    tlist = etree.SubElement(model, "qual:listOfTransitions")
-    graph = nx.DiGraph()
+    graph = {}  # type: Dict[str, Dict[str, str]]
     initial = {}
     if fixed:
         # dialect = csv.Sniffer().sniff(fixed.read(1024))
         # fixed.seek(0)
         for row in csv.reader(fixed):
             if row[0] in info:
-                info[row[0]]["transitions"] = []
-                info[row[0]]["function"] = row[1]
+                info[row[0]].transitions = []
+                info[row[0]].function = row[1]
                 initial[row[0]] = row[1]
             else:
                 logger.warning(f"Unknown '{row[0]}' could not be fixed.")
-    add_transitions(tlist, info, graph)
-    remove_connected_components(tlist, info, graph, remove)
+    if logic is None:
+        logic = model_logic(info)
+    known = set(info.keys())
+    inputs = get_inputs(info, known, graph)
+    removed = small_components(info, graph, remove)
+    # functions may still use the names of removed species
+    functions = add_functions(info, inputs, logic, removed)
+    for species in list(info.keys()):
+        if species in removed:
+            logger.debug("removing species {sp}", sp=species)
+            del info[species]
     if sif:
         write_sif(filename, info, graph)
-    add_qual_species(layout, qlist, info, initial)
-    etree.ElementTree(root).write(filename, encoding="utf-8", xml_declaration=True)
+    if isinstance(filename, str):
+        with open_file(filename, "wb") as f:
+            stream_qual(f, info, width, height, initial, inputs, logic, functions)
+    else:
+        stream_qual(filename, info, width, height, initial, inputs, logic, functions)
 
 
-def remove_connected_components(
-    tlist: etree.Element, info, graph: nx.DiGraph, remove: int
+def stream_qual(
+    fileobj: IO,
+    info,
+    width: str,
+    height: str,
+    initial: Dict[str, str],
+    inputs: Dict[str, List[Tuple[str, str]]],
+    logic: Dict[str, object],
+    functions: List[str],
 ):
-    """Remove connected components of size smaller than remove."""
-    # because we did not properly NameSpace all transitions, we cannot use
-    # find('./qual:transition[@qual:id=]')
+    # pylint: disable=too-many-arguments
+    """Write the SBML-qual document one species, glyph or transition at a time.
+
+    The output is the same as writing the whole tree with ElementTree.
+    """
+    # all namespaces have to be declared on the root, so find them first
+    used = [data.annotations for data in info.values() if data.annotations is not None]
+    for species in functions:
+        transitions = info[species].transitions
+        used.extend(
+            reaction.notes for reaction in transitions if reaction.notes is not None
+        )
+        used.extend(
+            reaction.annotations[0]
+            for reaction in transitions
+            if reaction.annotations is not None
+        )
+    prefixes = namespace_prefixes(used)
+    namespaces = "".join(
+        f' xmlns:{prefix}="{escape(uri, ATTRIBUTE_ENTITIES)}"'
+        for uri, prefix in sorted(prefixes.items(), key=lambda item: item[1])
+        if prefix != "xml"
+    )
+
+    with xml_writer(fileobj) as write:
+
+        def start(tag: str, attrib: Dict[str, str], declarations: str = ""):
+            write("<" + tag + declarations)
+            for key, value in attrib.items():
+                write(f' {key}="{escape(value, ATTRIBUTE_ENTITIES)}"')
+            write(">")
+
+        def element(elem: etree.Element):
+            serialize_xml(write, elem, prefixes)
+
+        def sequence(tag: str, elements: Iterator[etree.Element]):
+            """Write elements inside tag, or an empty tag if there are none."""
+            for elem in elements:
+                write(f"<{tag}>")
+                element(elem)
+                break
+            else:
+                write(f"<{tag} />")
+                return
+            for elem in elements:
+                element(elem)
+            write(f"</{tag}>")
+
+        write("<?xml version='1.0' encoding='utf-8'?>\n")
+        start(
+            "sbml",
+            {
+                "level": "3",
+                "version": "1",
+                "layout:required": "false",
+                "xmlns": NS["sbml3"],
+                "qual:required": "true",
+                "xmlns:layout": NS["layout"],
+                "xmlns:qual": NS["qual"],
+            },
+            namespaces,
+        )
+        start("model", {"id": "model_id"})
+        notes = etree.Element("notes")
+        html = etree.SubElement(notes, "html", xmlns=NS["xhtml"])
+        body = etree.SubElement(html, "body")
+        p = etree.SubElement(body, "p")
+        p.text = "Created by CaSQ " + version
+        element(notes)
+        clist = etree.Element("listOfCompartments")
+        etree.SubElement(clist, "compartment", constant="true", id="comp1")
+        element(clist)
+        write("<layout:listOfLayouts>")
+        start("layout:layout", {"id": "layout1"})
+        element(
+            etree.Element("layout:dimensions", width=width, height=height),
+        )
+        sequence("layout:listOfAdditionalGraphicalObjects", qual_glyphs(info))
+        write("</layout:layout></layout:listOfLayouts>")
+        sequence("qual:listOfQualitativeSpecies", qual_species(info, initial))
+        sequence(
+            "qual:listOfTransitions", qual_transitions(info, inputs, logic, functions)
+        )
+        write("</model></sbml>")
+
+
+def namespace_prefixes(elements: Iterable[etree.Element]) -> Dict[str, str]:
+    """Return the prefix of each namespace used in elements.
+
+    Namespaces of NS keep their prefix, the others are numbered ns0, ns1…
+    in order of appearance.
+    """
+    known = {uri: prefix for prefix, uri in NS.items()}
+    known[XML_NS] = "xml"
+    numbered = (f"ns{index}" for index in count())
+    prefixes = {}  # type: Dict[str, str]
+    for element in elements:
+        for elem in element.iter():
+            for name in chain((elem.tag,), elem.keys()):
+                if isinstance(name, str) and name[:1] == "{":
+                    uri = name[1:].partition("}")[0]
+                    if uri not in prefixes:
+                        prefixes[uri] = known.get(uri) or next(numbered)
+    return prefixes
+
+
+def qualified_name(name: str, prefixes: Dict[str, str]) -> str:
+    """Return name, with the prefix of its namespace if it has one."""
+    if name[:1] != "{":
+        return name
+    uri, local = name[1:].split("}", 1)
+    return prefixes[uri] + ":" + local
+
+
+def serialize_xml(write, elem: etree.Element, prefixes: Dict[str, str]):
+    """Write elem as ElementTree does, with the given namespace prefixes."""
+    if elem.tag is etree.Comment:
+        write(f"<!--{elem.text}-->")
+    elif elem.tag is etree.ProcessingInstruction:
+        write(f"<?{elem.text}?>")
+    else:
+        tag = qualified_name(elem.tag, prefixes)
+        write("<" + tag)
+        for key, value in elem.items():
+            name = qualified_name(key, prefixes)
+            write(f' {name}="{escape(value, ATTRIBUTE_ENTITIES)}"')
+        if elem.text or len(elem):
+            write(">")
+            if elem.text:
+                write(escape(elem.text))
+            for child in elem:
+                serialize_xml(write, child, prefixes)
+            write(f"</{tag}>")
+        else:
+            write(" />")
+    if elem.tail:
+        write(escape(elem.tail))
+
+
+@contextmanager
+def xml_writer(fileobj: IO):
+    """Give a function writing text to fileobj as ElementTree does."""
+    if isinstance(fileobj, io.TextIOBase):
+        yield fileobj.write
+        return
+    text = io.TextIOWrapper(
+        fileobj, encoding="utf-8", errors="xmlcharrefreplace", newline="\n"
+    )
+    try:
+        yield text.write
+        text.flush()
+    finally:
+        text.detach()
+
+
+def small_components(info, graph: Dict[str, Dict[str, str]], remove: int):
+    """Return the species in connected components of size at most remove.
+
+    If remove is negative, all components but the largest ones are removed.
+    """
     logger.debug("remove value {S}", S=remove)
-    transitions = list(tlist)
-    ccs = list(nx.connected_components(graph.to_undirected()))
-    # add completely isolated nodes
-    nodes = graph.nodes()
-    ccs.extend({species} for (species, data) in info.items() if species not in nodes)
+    merged = {}  # type: Dict[str, str]
+    for source, targets in graph.items():
+        for target in targets:
+            merge(merged, source, target)
+    components = {}  # type: Dict[str, List[str]]
+    for species in info:
+        components.setdefault(find_merged(merged, species), []).append(species)
+    ccs = list(components.values())
     logger.debug("CCs: {ccs}", ccs=ccs)
     if remove < 0:
-        remove = len(max(ccs, key=len)) - 1
+        remove = max((len(component) for component in ccs), default=0) - 1
     logger.debug("remove value {S}", S=remove)
+    removed = set()
     for component in filter(lambda x: len(x) <= remove, ccs):
-        logger.debug(
-            "removing connected component {component}", component=list(component)
-        )
-        for species in component:
-            logger.debug("removing species {sp}", sp=species)
-            del info[species]
-            trans_id = "tr_" + species
-            trans = next((t for t in transitions if t.get("qual:id") == trans_id), None)
-            if trans:
-                logger.debug("removing transition {tr}", tr=trans)
-                tlist.remove(trans)
+        logger.debug("removing connected component {component}", component=component)
+        removed.update(component)
+    return removed
 
 
-def write_sif(sbml_filename: str, info, graph: nx.DiGraph):
+def write_sif(sbml_filename: str, info, graph: Dict[str, Dict[str, str]]):
     """Write a SIF file with influences.
 
     http://www.cbmc.it/fastcent/doc/SifFormat.htm
     """
-    with open(sbml_filename[:-4] + "sif", "w", encoding="utf-8", newline="") as f:
+    base, ext = split_compression(sbml_filename)
+    with open_file(base[:-4] + "sif" + ext, "w", newline="") as f:
         print(f"# Generated by CaSQ v{version}", file=f)
-        with open(
-            sbml_filename[:-5] + "_raw.sif", "w", encoding="utf-8", newline=""
-        ) as fraw:
+        with open_file(base[:-5] + "_raw.sif" + ext, "w", newline="") as fraw:
             print(f"# Generated by CaSQ v{version}", file=fraw)
-            for source, target, sign in graph.edges.data("sign"):
+            for source, target, sign in (
+                (source, target, sign)
+                for source, targets in graph.items()
+                # removed components are closed, no need to check target
+                if source in info
+                for target, sign in targets.items()
+            ):
                 print(
                     source.replace(" ", "_"),
                     sign.upper(),
@@ -138,52 +301,51 @@ def write_sif(sbml_filename: str, info, graph: nx.DiGraph):
                     file=fraw,
                 )
                 print(
-                    info[source]["name"].replace(" ", "_"),
+                    info[source].name.replace(" ", "_"),
                     sign.upper(),
-                    info[target]["name"].replace(" ", "_"),
+                    info[target].name.replace(" ", "_"),
                     file=f,
                 )
 
 
-def add_qual_species(
-    layout: etree.Element, qlist: etree.Element, info, initial: Dict[str, str]
-):
-    """Create layout sub-elements and species."""
-    llist = etree.SubElement(layout, "layout:listOfAdditionalGraphicalObjects")
+def qual_glyphs(info) -> Iterator[etree.Element]:
+    """Create the layout glyph of each species."""
     for species, data in info.items():
-        glyph = etree.SubElement(
-            llist,
+        glyph = etree.Element(
             "layout:generalGlyph",
             {"layout:reference": species, "layout:id": species + "_glyph"},
         )
         box = etree.SubElement(glyph, "layout:boundingBox")
         etree.SubElement(
-            box, "layout:position", {"layout:x": data["x"], "layout:y": data["y"]}
+            box, "layout:position", {"layout:x": data.x, "layout:y": data.y}
         )
         etree.SubElement(
             box,
             "layout:dimensions",
-            {"layout:height": data["h"], "layout:width": data["w"]},
+            {"layout:height": data.h, "layout:width": data.w},
         )
-        if data["transitions"]:
+        yield glyph
+
+
+def qual_species(info, initial: Dict[str, str]) -> Iterator[etree.Element]:
+    """Create each qualitative species."""
+    for species, data in info.items():
+        if data.transitions:
             constant = "false"
         else:
             constant = "true"
         attribs = {
             "qual:maxLevel": "1",
             "qual:compartment": "comp1",
-            "qual:name": data["name"],
+            "qual:name": data.name,
             "qual:constant": constant,
             "qual:id": species,
         }
         if species in initial:
             attribs["qual:initialLevel"] = initial[species]
-        qspecies = etree.SubElement(
-            qlist,
-            "qual:qualitativeSpecies",
-            attribs,
-        )
-        add_annotation(qspecies, data["annotations"])
+        qspecies = etree.Element("qual:qualitativeSpecies", attribs)
+        add_annotation(qspecies, data.annotations)
+        yield qspecies
 
 
 def add_annotation(node: etree.Element, rdf: Optional[etree.Element]):
@@ -192,50 +354,96 @@ def add_annotation(node: etree.Element, rdf: Optional[etree.Element]):
         etree.SubElement(node, "annotation").append(rdf)
 
 
-def add_transitions(tlist: etree.Element, info, graph: nx.DiGraph):
-    """Create transition elements."""
-    known = list(info.keys())
+def get_inputs(
+    info, known: Set[str], graph: Dict[str, Dict[str, str]]
+) -> Dict[str, List[Tuple[str, str]]]:
+    """Find the inputs of the transition of each species and record influences.
+
+    Species whose transitions have no known input get no transition at all.
+    """
+    inputs = {}
     for species, data in info.items():
-        if data["transitions"]:
-            trans = etree.SubElement(
-                tlist, "qual:transition", {"qual:id": "tr_" + species}
-            )
-            ilist = etree.SubElement(trans, "qual:listOfInputs")
-            add_inputs(ilist, data["transitions"], species, known, graph)
+        if data.transitions:
+            graph.setdefault(species, {})
+            species_inputs = add_inputs(data.transitions, species, known, graph)
             # there might not be any input left after filtering known species
-            if len(ilist) == 0:
-                tlist.remove(trans)
+            if species_inputs:
+                inputs[species] = species_inputs
+            else:
                 logger.debug(
                     "transition for {species} exists {trans} but has no inputs",
-                    trans=data["transitions"],
+                    trans=data.transitions,
                     species=species,
                 )
-                info[species]["transitions"] = []
-                add_function_as_rdf(info, species, info[species]["function"])
-            else:
-                olist = etree.SubElement(trans, "qual:listOfOutputs")
-                etree.SubElement(
-                    olist,
-                    "qual:output",
-                    {
-                        "qual:qualitativeSpecies": species,
-                        "qual:transitionEffect": "assignmentLevel",
-                        "qual:id": f"tr_{species}_out",
-                    },
-                )
-                flist = etree.SubElement(trans, "qual:listOfFunctionTerms")
-                etree.SubElement(flist, "qual:defaultTerm", {"qual:resultLevel": "0"})
-                func = etree.SubElement(
-                    flist, "qual:functionTerm", {"qual:resultLevel": "1"}
-                )
-                add_function(func, data["transitions"], known)
-                sfunc = mathml_to_ginsim(func.find("./math/*", NS), info)
-                info[species]["function"] = sfunc
-                add_function_as_rdf(info, species, sfunc)
-                add_notes(trans, data["transitions"])
-                add_annotations(trans, data["transitions"])
+                info[species].transitions = []
+    return inputs
+
+
+def add_functions(
+    info, inputs: Dict[str, List[Tuple[str, str]]], logic: Dict[str, object], removed
+) -> List[str]:
+    """Return the kept species that have a transition.
+
+    Add the functions, in GINsim format, as RDF annotations of kept species.
+    Their MathML is only created when their transition is written.
+    """
+    functions = []
+    for species, data in info.items():
+        if species in removed:
+            continue
+        if species in inputs:
+            sfunc = to_ginsim(logic[species], lambda sp: info[sp].name)
+            info[species].function = sfunc
+            add_function_as_rdf(info, species, sfunc)
+            for reaction in data.transitions:
+                if reaction.notes is not None:
+                    clean_notes(reaction.notes)
+            functions.append(species)
         else:
-            add_function_as_rdf(info, species, info[species]["function"])
+            add_function_as_rdf(info, species, info[species].function)
+    return functions
+
+
+def qual_transitions(
+    info,
+    inputs: Dict[str, List[Tuple[str, str]]],
+    logic: Dict[str, object],
+    functions: List[str],
+) -> Iterator[etree.Element]:
+    """Create each transition, with the MathML of its function."""
+    for species in functions:
+        transitions = info[species].transitions
+        trans = etree.Element("qual:transition", {"qual:id": "tr_" + species})
+        ilist = etree.SubElement(trans, "qual:listOfInputs")
+        for index, (modifier, sign) in enumerate(inputs[species]):
+            etree.SubElement(
+                ilist,
+                "qual:input",
+                {
+                    "qual:qualitativeSpecies": modifier,
+                    "qual:transitionEffect": "none",
+                    "qual:sign": sign,
+                    "qual:id": f"tr_{species}_in_{index}",
+                },
+            )
+        olist = etree.SubElement(trans, "qual:listOfOutputs")
+        etree.SubElement(
+            olist,
+            "qual:output",
+            {
+                "qual:qualitativeSpecies": species,
+                "qual:transitionEffect": "assignmentLevel",
+                "qual:id": f"tr_{species}_out",
+            },
+        )
+        flist = etree.SubElement(trans, "qual:listOfFunctionTerms")
+        etree.SubElement(flist, "qual:defaultTerm", {"qual:resultLevel": "0"})
+        func = etree.SubElement(flist, "qual:functionTerm", {"qual:resultLevel": "1"})
+        math = etree.SubElement(func, "math", xmlns=NS["mathml"])
+        to_mathml(logic[species], math)
+        add_notes(trans, transitions)
+        add_annotations(trans, transitions)
+        yield trans
 
 
 def add_notes(trans: etree.Element, transitions: List[Transition]):
@@ -249,17 +457,21 @@ def add_notes(trans: etree.Element, transitions: List[Transition]):
     for reaction in transitions:
         if reaction.notes is not None:
             some_notes = True
-            reaction.notes.tag = "p"
-            for element in reaction.notes.iter():
-                for prefix in ("xhtml", "sbml"):
-                    prefix_len = len(NS[prefix]) + 2
-                    if element.tag.startswith("{" + NS[prefix] + "}"):
-                        element.tag = element.tag[prefix_len:]
             body.append(reaction.notes)
     if not some_notes:
         trans.remove(notes)
 
 
+def clean_notes(notes: etree.Element):
+    """Turn the body of some notes into an unqualified paragraph."""
+    notes.tag = "p"
+    for element in notes.iter():
+        for prefix in ("xhtml", "sbml"):
+            prefix_len = len(NS[prefix]) + 2
+            if element.tag.startswith("{" + NS[prefix] + "}"):
+                element.tag = element.tag[prefix_len:]
+
+
 def add_annotations(trans: etree.Element, transitions: List[Transition]):
     """Add all the found annotations."""
     annotation = etree.SubElement(trans, "annotation")
@@ -271,85 +483,6 @@ def add_annotations(trans: etree.Element, transitions: List[Transition]):
         trans.remove(annotation)
 
 
-def add_function(func: etree.Element, transitions: List[Transition], known: List[str]):
-    """Add the complete boolean activation function.
-
-    this is an or over all reactions having the target as product.
-    For each reaction it can activate if all reactants are present,
-    no inhibitor is present, and one of the activators is present.
-    """
-    math = etree.SubElement(func, "math", xmlns=NS["mathml"])
-    # create or node if necessary
-    if len(transitions) > 1:
-        apply = etree.SubElement(math, "apply")
-        etree.SubElement(apply, "or")
-    else:
-        apply = math
-    for reaction in transitions:
-        # we assume that only "BOOLEAN_LOGIC_GATE_AND" has multiple modifiers
-        # it is also the only modification that has an AND and therefore ends
-        # with reactants
-        reactants = [reac for reac in reaction.reactants if reac in known]
-        reactants.extend(
-            [
-                mod
-                for (modtype, modifier) in reaction.modifiers
-                for mod in modifier.split(",")
-                if modtype == "BOOLEAN_LOGIC_GATE_AND" and mod in known
-            ]
-        )
-        activators = [
-            modifier
-            for (modtype, modifier) in reaction.modifiers
-            if modtype
-            not in ("INHIBITION", "UNKNOWN_INHIBITION", "BOOLEAN_LOGIC_GATE_AND")
-            and modifier in known
-            and modifier not in reactants
-        ]
-        inhibitors = [
-            modifier
-            for (modtype, modifier) in reaction.modifiers
-            if modtype in INHIBITION and modifier in known
-        ]
-        # this should only appear when species is of type PHENOTYPE otherwise
-        # non-SBGN compliant, and there should be a single reactant and no inhibitors
-        # just swap reactants and inhibitors, there should not be any activator
-        if reaction.type in NEGATIVE:
-            reactants, inhibitors = inhibitors, reactants
-            if activators or reactants:
-                logger.error("non-SBGN direct inhibition encountered")
-        # create and node if necessary
-        if len(reactants) + len(inhibitors) > 1 or (
-            activators and (reactants or inhibitors)
-        ):
-            lapply = etree.SubElement(apply, "apply")
-            etree.SubElement(lapply, "and")
-        else:
-            lapply = apply
-        if len(activators) < 2:
-            reactants.extend(activators)
-        else:
-            # create or node if necessary
-            inner_apply = etree.SubElement(lapply, "apply")
-            etree.SubElement(inner_apply, "or")
-            for modifier in activators:
-                set_level(inner_apply, modifier, "1")
-        for level, modifier in chain(
-            zip(repeat("1"), reactants), zip(repeat("0"), inhibitors)
-        ):
-            set_level(lapply, modifier, level)
-
-
-def set_level(elt: etree.Element, modifier: str, level: str):
-    """Add mathml to element elt such that modifier is equal to level."""
-    trigger = etree.SubElement(elt, "apply")
-    etree.SubElement(trigger, "eq")
-    math_ci = etree.SubElement(trigger, "ci")
-    math_ci.text = modifier
-    math_cn = etree.SubElement(trigger, "cn", type="integer")
-    math_cn.text = level
-
-
 def negate(sign: str):
     """Change a sign represented as a string."""
     if sign == "negative":
@@ -358,16 +491,14 @@ def negate(sign: str):
 
 
 def add_inputs(
-    ilist: etree.Element,
     transitions: List[Transition],
     species: str,
-    known: List[str],
-    graph: nx.DiGraph,
-):
-    """Add all known inputs."""
-    index = 0
-    modifiers = []  # type: List[Tuple[str, str]]
-    graph.add_node(species)
+    known: Set[str],
+    graph: Dict[str, Dict[str, str]],
+) -> List[Tuple[str, str]]:
+    """Return all known inputs with their sign, recording them in graph."""
+    # keys of a dict, to keep them in order
+    modifiers = {}  # type: Dict[Tuple[str, str], None]
     for reaction in transitions:
         # we use enumerate to get a dummy modtype for reactants
         for modtype, modifier in chain(
@@ -382,58 +513,25 @@ def add_inputs(
             if reaction.type in NEGATIVE:
                 sign = negate(sign)
                 logger.warning("non-SBGN direct negative reaction found")
-            if (modifier, sign) not in modifiers and modifier in known:
-                modifiers.append((modifier, sign))
-                graph.add_edge(modifier, species, sign=sign)
-                etree.SubElement(
-                    ilist,
-                    "qual:input",
-                    {
-                        "qual:qualitativeSpecies": modifier,
-                        "qual:transitionEffect": "none",
-                        "qual:sign": sign,
-                        "qual:id": f"tr_{species}_in_{index}",
-                    },
-                )
-                index += 1
+            if modifier in known and (modifier, sign) not in modifiers:
+                modifiers[modifier, sign] = None
+                graph.setdefault(modifier, {})[species] = sign
+    return list(modifiers)
 
 
 def write_csv(sbml_filename: str, info):
     """Write a csv file with SBML IDs, CD IDs, Names, Formulae, etc."""
     # pylint: disable=invalid-name
     sorted_items = sorted(info.items())
-    with open(sbml_filename[:-4] + "csv", "w", encoding="utf-8", newline="") as f:
+    base, ext = split_compression(sbml_filename)
+    with open_file(base[:-4] + "csv" + ext, "w", newline="") as f:
         writer = csv.writer(f)
         for species, data in sorted_items:
-            writer.writerow(
-                [species, data["name"], data["ref_species"], data["function"]]
-            )
-    with open(sbml_filename[:-4] + "bnet", "w", encoding="utf-8") as f:
+            writer.writerow([species, data.name, data.ref_species, data.function])
+    with open_file(base[:-4] + "bnet" + ext, "w") as f:
         print("# Created with CaSQ\n\ntargets, factors", file=f)
         for _, data in sorted_items:
-            print(data["name"] + ", " + data["function"], file=f)
-
-
-def mathml_to_ginsim(math: Optional[etree.Element], info) -> str:
-    """Convert a MATHML boolean formula into its GinSIM representation."""
-    if math is None:
-        raise ValueError("Empty math element")
-    if math.tag != "apply":
-        raise ValueError(etree.tostring(math))
-    children = list(math)
-    if children[0].tag == "and":
-        return "&".join(mathml_to_ginsim(x, info) for x in children[1:])
-    if children[0].tag == "or":
-        return "(" + "|".join(mathml_to_ginsim(x, info) for x in children[1:]) + ")"
-    if children[0].tag == "eq":
-        species = children[1].text
-        species = info[species]["name"]
-        if species is None:
-            species = ""
-        if children[2].text == "0":
-            return "!" + species
-        return species
-    raise ValueError(etree.tostring(math))
+            print(data.name + ", " + data.function, file=f)
 
 
 def add_function_as_rdf(info, species: str, func: str):
@@ -442,7 +540,7 @@ def add_function_as_rdf(info, species: str, func: str):
     descr = etree.SubElement(
         rdf,
         f"{{{NS['rdf']}}}Description",
-        attrib={f"{{{NS['rdf']}}}about": "#" + info[species]["ref_species"]},
+        attrib={f"{{{NS['rdf']}}}about": "#" + info[species].ref_species},
     )
     bqbiol = etree.SubElement(descr, f"{{{NS['bqbiol']}}}isDescribedBy")
     bag = etree.SubElement(bqbiol, f"{{{NS['rdf']}}}Bag")
@@ -457,7 +555,7 @@ def add_function_as_rdf(info, species: str, func: str):
         bag,
         f"{{{NS['rdf']}}}li",
         attrib={
-            f"{{{NS['rdf']}}}resource": "urn:casq:cdid:" + info[species]["ref_species"]
+            f"{{{NS['rdf']}}}resource": "urn:casq:cdid:" + info[species].ref_species
         },
     )
     add_rdf(info, species, rdf)
@@ -1,14 +1,42 @@
 """Tests for CaSQ."""
 
+import copy
+import io
+import itertools
+import json
+import xml.etree.ElementTree as etree
 from filecmp import cmp
 from glob import glob
 from os import path
 from unittest.mock import patch
+from zipfile import ZipFile
 
 import pytest  # type: ignore
 
+from casq import fixpoints, screen, simulate
+from casq.aeonExport import add_relationship, aeon_relationship
+from casq.bmaExport import get_relationships
 from casq.celldesigner2qual import main, map_to_model
-from casq.utils import validate
+from casq.logic import Not, Var, model_logic, species_logic, to_aeon, to_bma, to_ginsim
+from casq.names import aeon_name, bma_name
+from casq.readCD import Species, Transition
+from casq.reduce import Reduction, reduce_model
+from casq.simplify import (
+    add_consumer,
+    build_consumers,
+    get_active,
+    merge,
+    reachable,
+    remove_consumer,
+    replace_in_transitions,
+)
+from casq.utils import open_file
+from casq.validator import validate, validate_files
+from casq.write import namespace_prefixes, serialize_xml
+
+MAPS = glob(
+    path.join(str(path.dirname(path.realpath(__file__))), "..", "cd_maps", "*.xml")
+)
 
 
 @pytest.mark.parametrize(
@@ -27,3 +55,526 @@ def test_casq_produces_valid_files(tmp_path, infile):
     map_to_model(infile, outfile + "_api")
 
     assert cmp(outfile, outfile + "_api")
+
+
+@pytest.mark.parametrize("infile", MAPS)
+def test_low_memory_reader_is_identical(tmp_path, infile):
+    """Check that the streaming reader does not change the output."""
+    outfile = path.join(str(tmp_path), "model.sbml")
+    main([infile, outfile])
+    main(["--low-memory", infile, outfile + "_stream"])
+
+    assert cmp(outfile, outfile + "_stream")
+
+
+def test_species_is_a_dict_compatible_record():
+    """Check that species records can still be used as dicts."""
+    species = Species(name="A", transitions=[])
+    species["function"] = "B"
+
+    assert species.function == "B"
+    assert species["name"] == "A"
+    assert dict(species) == {"transitions": [], "name": "A", "function": "B"}
+    assert "clean_name" not in species
+    with pytest.raises(KeyError):
+        species["unknown"] = 1
+
+
+def test_get_active_uses_consumers():
+    """Check that consumers follow changes and count transitions."""
+    trans = Transition(
+        "STATE_TRANSITION", ("sa1",), (("CATALYSIS", "sa2,sa1"),), None, None
+    )
+    info = {
+        "sa1": Species(transitions=[]),
+        "sa2": Species(transitions=[]),
+        "sa3": Species(transitions=[trans]),
+    }
+    consumers = build_consumers(info)
+
+    assert get_active("sa1", consumers) == "sa3"
+    assert get_active("sa3", consumers) is None
+    add_consumer(consumers, "sa1", [trans])
+    assert get_active("sa2", consumers) is False
+    remove_consumer(consumers, "sa3", info["sa3"].transitions)
+    assert get_active("sa2", consumers) == "sa1"
+    add_consumer(consumers, "sa1", [trans])
+    assert get_active("sa2", consumers) is False
+
+
+def test_chained_merges_are_composed():
+    """Check that transitions use the last species of a chain of merges."""
+    trans = Transition(
+        "STATE_TRANSITION", ("sa1", "sa4"), (("CATALYSIS", "sa2,sa4"),), None, None
+    )
+    info = {"sa3": Species(transitions=[trans]), "sa5": Species(transitions=[trans])}
+    merged = {}
+    merge(merged, "sa1", "sa2")
+    merge(merged, "sa2", "sa3")
+    replace_in_transitions(info, merged, {"sa3": "C"})
+
+    assert info["sa3"].transitions == info["sa5"].transitions
+    assert info["sa3"].transitions[0].reactants == ("sa4", "C")
+    assert info["sa3"].transitions[0].modifiers == (("CATALYSIS", "sa4,C"),)
+
+
+def test_reachable_with_max_depth():
+    """Check that restriction can stop after some number of steps."""
+    adjacency = {"a": {"b"}, "b": {"c"}, "c": {"a", "d"}, "e": {"a"}}
+
+    assert reachable(adjacency, ["a"]) == {"a", "b", "c", "d"}
+    assert reachable(adjacency, ["a", "e"], 0) == {"a", "e"}
+    assert reachable(adjacency, ["a"], 2) == {"a", "b", "c"}
+
+
+def test_exporters_share_the_logic():
+    """Check that all formats render the same function, AND gates included."""
+    trans = Transition(
+        "STATE_TRANSITION",
+        ("sa1",),
+        (
+            ("BOOLEAN_LOGIC_GATE_AND", "sa2,sa3"),
+            ("INHIBITION", "sa4"),
+            ("CATALYSIS", "sa5"),
+            ("CATALYSIS", "sa6"),
+        ),
+        None,
+        None,
+    )
+    function = species_logic([trans], {"sa1", "sa2", "sa3", "sa4", "sa5"})
+
+    assert to_ginsim(function, str.upper) == "SA1&SA2&SA3&SA5&!SA4"
+    assert to_aeon(function, str.upper, lambda names: f"f({', '.join(names)})") == (
+        "(SA1 & SA2 & SA3 & f(SA5) & !SA4)"
+    )
+    assert to_bma(function, lambda species: int(species[2:])) == (
+        "min(var(1),var(2),var(3),var(5),1-var(4))"
+    )
+    # members of an AND gate that are also reactants are required once
+    gate = trans._replace(modifiers=(("BOOLEAN_LOGIC_GATE_AND", "sa1,sa2"),))
+    assert to_ginsim(species_logic([gate], {"sa1", "sa2"}), str.upper) == "SA1&SA2"
+    # and catalysts of an inhibition that are also its reactants still count
+    inhibition = Transition(
+        "NEGATIVE_INFLUENCE", ("sa1",), (("CATALYSIS", "sa1"),), None, None
+    )
+    assert to_ginsim(species_logic([inhibition], {"sa1"}), str.upper) == "SA1&!SA1"
+
+
+def test_bma_relationships_are_unique():
+    """Check that AND gate members also listed as catalysts are related once."""
+    info = {
+        "a": Species(transitions=[], name="a"),
+        "b": Species(transitions=[], name="b"),
+        "c": Species(
+            transitions=[
+                Transition(
+                    "STATE_TRANSITION",
+                    ("a",),
+                    (
+                        ("BOOLEAN_LOGIC_GATE_AND", "a,b"),
+                        ("CATALYSIS", "a"),
+                        ("CATALYSIS", "b"),
+                    ),
+                    None,
+                    None,
+                )
+            ],
+            name="c",
+        ),
+    }
+    relationships, _ = get_relationships(
+        info, {"a": 1, "b": 2, "c": 3}, itertools.count(), 1, False, model_logic(info)
+    )
+
+    assert [(r["FromVariable"], r["Type"]) for r in relationships] == [
+        (1, "Activator"),
+        (2, "Activator"),
+    ]
+
+
+def test_aeon_relationships_are_fused():
+    """Check that regulations between the same variables are merged."""
+    relationships = {}
+    add_relationship(relationships, aeon_relationship("a", "c", "CATALYSIS"))
+    add_relationship(relationships, aeon_relationship("b", "c", "INHIBITION"))
+    add_relationship(relationships, aeon_relationship("a", "c", "UNKNOWN_INHIBITION"))
+
+    assert list(relationships) == [("a", "c"), ("b", "c")]
+    assert relationships["a", "c"]["type"] == "non_monotonic"
+    assert relationships["a", "c"]["unknown"] is False
+    assert relationships["b", "c"]["type"] == "inhibition"
+
+
+def test_names_are_normalised():
+    """Check the identifiers used in BMA and AEON."""
+    assert bma_name("TNFα (p-65)") == "TNFa__p_65_"
+    assert aeon_name("TNFα (p-65)*") == "TNFa__p_65__"
+    assert bma_name("IκB*") == "IkB*"
+
+
+@pytest.mark.parametrize("use_numpy", sorted({False, simulate.NUMPY}))
+def test_synchronous_simulation(use_numpy):
+    """Check a small negative loop with an input."""
+    info = {
+        "a": Species(transitions=[]),
+        "b": Species(
+            transitions=[
+                Transition(
+                    "STATE_TRANSITION",
+                    ("a",),
+                    (("INHIBITION", "c"),),
+                    None,
+                    None,
+                )
+            ]
+        ),
+        "c": Species(transitions=[Transition("TRANSPORT", ("b",), (), None, None)]),
+    }
+    model = simulate.compile_model(info)
+    states = [{"a": 1}, {"a": 1, "c": 1}, {"b": 1}]
+    packed = simulate.pack_states(model, states, use_numpy)
+
+    assert simulate.unpack_states(model, simulate.step(model, packed)) == [
+        {"a": 1, "b": 1, "c": 0},
+        {"a": 1, "b": 0, "c": 0},
+        {"a": 0, "b": 0, "c": 1},
+    ]
+    after = simulate.simulate(model, packed, 4)
+    # b and c cycle with period 4 while a is active, and vanish otherwise
+    assert simulate.activity(model, after) == {"a": 2 / 3, "b": 0, "c": 1 / 3}
+
+
+def test_asynchronous_ensemble():
+    """Check a chain from an active input to a phenotype."""
+    info = {
+        "a": Species(transitions=[], type="PROTEIN"),
+        "b": Species(
+            transitions=[Transition("TRANSPORT", ("a",), (), None, None)],
+            type="PROTEIN",
+        ),
+        "c": Species(
+            transitions=[Transition("TRANSPORT", ("b",), (), None, None)],
+            type="PHENOTYPE",
+        ),
+    }
+    initial = {"a": 1, "b": 0, "c": 0}
+    runs = simulate.CHUNK + 1000
+    ensemble = simulate.async_ensemble(info, runs, 4, every=2, initial=initial)
+
+    assert ensemble.times == [0, 2, 4]
+    assert list(ensemble.frequencies) == ["c"]
+    # c needs b to be updated first, then itself
+    assert list(ensemble.frequencies["c"]) == pytest.approx(
+        [0, 1 / 4, 11 / 16], abs=0.02
+    )
+    assert ensemble.reached["c"] == ensemble.frequencies["c"][-1]
+    assert ensemble == simulate.async_ensemble(
+        info, runs, 4, every=2, initial=initial, jobs=2
+    )
+
+
+def test_fixed_points():
+    """Check a negative loop, a positive one and an unused input."""
+    info = {
+        "a": Species(transitions=[]),
+        "b": Species(
+            transitions=[
+                Transition(
+                    "STATE_TRANSITION",
+                    ("a",),
+                    (("INHIBITION", "c"),),
+                    None,
+                    None,
+                )
+            ]
+        ),
+        "c": Species(transitions=[Transition("TRANSPORT", ("b",), (), None, None)]),
+        "d": Species(transitions=[Transition("TRANSPORT", ("d",), (), None, None)]),
+        "e": Species(transitions=[]),
+    }
+    result = fixpoints.fixed_points(info)
+
+    # a must be inactive to break the negative loop, e is free
+    assert result.cubes == [
+        {"a": 0, "b": 0, "c": 0, "d": 0},
+        {"a": 0, "b": 0, "c": 0, "d": 1},
+    ]
+    assert result.count == 4
+    assert result.complete
+    assert fixpoints.fixed_points(info, {"a": 1}).count == 0
+    assert fixpoints.fixed_points(info, {"zz": 1}).cubes == result.cubes
+    assert fixpoints.fixed_points(info, {"d": 1}).cubes == [
+        {"a": 0, "b": 0, "c": 0, "d": 1}
+    ]
+    assert not fixpoints.fixed_points(info, limit=1).complete
+
+
+def test_screen_perturbations():
+    """Check knockouts and knock-ins upstream of a phenotype."""
+    info = {
+        "a": Species(transitions=[], type="PROTEIN"),
+        "b": Species(
+            transitions=[Transition("TRANSPORT", ("a",), (), None, None)],
+            type="PROTEIN",
+        ),
+        "c": Species(
+            transitions=[Transition("TRANSPORT", ("b",), (), None, None)],
+            type="PHENOTYPE",
+        ),
+    }
+    variants = list(screen.perturbations(["a", "b"], True))
+    assert len(variants) == 8
+    assert variants[-1] == {"a": 1, "b": 1}
+
+    model = screen.screened_model(info, {})
+    assert list(screen.screen(model, variants[:4], 1)) == [
+        ["1", "0"],
+        ["1", "1"],
+        ["2", "0"],
+        ["2", "1"],
+    ]
+    model = screen.screened_model(info, {}, "reach", runs=100, steps=20)
+    (knockout,), (knockin,) = screen.screen(model, variants[:2], 1)
+    # c only gets activated by b if b was initially active and c updated first
+    assert float(knockout) == pytest.approx(1 / 4, abs=0.1)
+    assert knockin == "1.0000"
+
+
+def test_reduce_model():
+    """Check percolation of a fixed species, merge of a copy and unused removal."""
+
+    def transport(*reactants, modifiers=()):
+        return [Transition("TRANSPORT", reactants, modifiers, None, None)]
+
+    info = {
+        "a": Species(name="A", transitions=[], type="PROTEIN"),
+        "b": Species(
+            name="B",
+            transitions=transport("a", modifiers=(("INHIBITION", "c"),)),
+            type="PROTEIN",
+        ),
+        "c": Species(name="C", transitions=[], type="PROTEIN"),
+        "d": Species(name="D", transitions=transport("b"), type="PROTEIN"),
+        "e": Species(name="E", transitions=transport("d"), type="PHENOTYPE"),
+        "f": Species(
+            name="F",
+            transitions=transport("b", modifiers=(("INHIBITION", "c"),)),
+            type="PROTEIN",
+        ),
+    }
+    reduced = copy.deepcopy(info)
+    assert reduce_model(reduced, {"a": 1}) == {
+        "a": Reduction("A", 1, None),
+        "d": Reduction("D", None, "b"),
+        "f": Reduction("F", None, None),
+    }
+    assert model_logic(reduced) == {"b": Not("c"), "e": Var("b")}
+
+    reduced = copy.deepcopy(info)
+    assert reduce_model(reduced, {"c": 1}) == {
+        "c": Reduction("C", 1, None),
+        "b": Reduction("B", 0, None),
+        "d": Reduction("D", 0, None),
+        "f": Reduction("F", 0, None),
+        "e": Reduction("E", 0, None),
+        "a": Reduction("A", None, None),
+    }
+    assert not reduced
+
+    # merged or fixed species must not change the function of the others
+    info = {
+        "x": Species(name="X", transitions=[], type="PROTEIN"),
+        "w": Species(name="W", transitions=[], type="PROTEIN"),
+        "y": Species(name="Y", transitions=transport("x"), type="PROTEIN"),
+        "z": Species(
+            name="Z",
+            transitions=transport(
+                "x", modifiers=(("CATALYSIS", "y"), ("CATALYSIS", "w"))
+            ),
+            type="PHENOTYPE",
+        ),
+        "p": Species(
+            name="P",
+            transitions=transport(
+                modifiers=(("CATALYSIS", "x"), ("TRIGGER", "w"), ("INHIBITION", "w"))
+            ),
+            type="PHENOTYPE",
+        ),
+    }
+    reduced = copy.deepcopy(info)
+    assert reduce_model(reduced) == {"y": Reduction("Y", None, "x")}
+    assert model_logic(reduced)["z"] == Var("x")
+    reduced = copy.deepcopy(info)
+    reduce_model(reduced, {"x": 1})
+    assert model_logic(reduced) == {"p": Not("w")}
+
+
+def test_serialize_xml():
+    """Check that pieces are written as ElementTree does, with our prefixes."""
+    rdf = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+    elem = etree.Element(f"{{{rdf}}}RDF", {f"{{{rdf}}}about": 'a "b"\n<c>'})
+    etree.SubElement(elem, "{http://example.org/}li").text = "d & e"
+    prefixes = namespace_prefixes([elem])
+    assert prefixes == {rdf: "rdf", "http://example.org/": "ns0"}
+
+    out = io.StringIO()
+    serialize_xml(out.write, elem, prefixes)
+    assert out.getvalue() == (
+        '<rdf:RDF rdf:about="a &quot;b&quot;&#10;&lt;c&gt;">'
+        "<ns0:li>d &amp; e</ns0:li></rdf:RDF>"
+    )
+
+
+def test_cached_model_is_identical(tmp_path):
+    """Check that models read back from the cache give the same output."""
+    infile = MAPS[0]
+    cache_dir = path.join(str(tmp_path), "cache")
+    outfile = path.join(str(tmp_path), "model.bma.json")
+    main(["-b", infile, outfile])
+    main(["-b", "--cache-dir", cache_dir, infile, outfile + "_cold"])
+    main(["-b", "--cache-dir", cache_dir, infile, outfile + "_warm"])
+
+    (entry,) = glob(path.join(cache_dir, "*.pickle"))
+    assert cmp(outfile, outfile + "_cold")
+    assert cmp(outfile, outfile + "_warm")
+
+    # entries whose checksum does not match are rebuilt, not unpickled
+    with open(entry, "r+b") as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 1]))
+    with patch("pickle.loads") as loads:
+        main(["-b", "--cache-dir", cache_dir, infile, outfile + "_broken"])
+    loads.assert_not_called()
+    assert cmp(outfile, outfile + "_broken")
+    main(["-b", "--cache-dir", cache_dir, infile, outfile + "_fixed"])
+    assert cmp(outfile, outfile + "_fixed")
+
+
+@pytest.mark.parametrize("ext", [".gz", ".bz2", ".xz"])
+def test_compressed_input_and_output(tmp_path, ext):
+    """Check that compressed files give the same model as plain ones."""
+    infile = MAPS[0]
+    outfile = path.join(str(tmp_path), "model.sbml")
+    main([infile, outfile])
+    compressed = path.join(str(tmp_path), "map.xml" + ext)
+    with open(infile, "rb") as f, open_file(compressed, "wb") as g:
+        g.write(f.read())
+    main(["-s", compressed])
+
+    with open(outfile, "rb") as f, open_file(
+        compressed[: -4 - len(ext)] + ".sbml" + ext, "rb"
+    ) as g:
+        assert f.read() == g.read()
+    assert path.exists(path.join(str(tmp_path), "map.sif" + ext))
+
+
+def test_zipped_input(tmp_path):
+    """Check that a map can be read from a zip archive."""
+    infile = MAPS[0]
+    outfile = path.join(str(tmp_path), "model.sbml")
+    main([infile, outfile])
+    archive = path.join(str(tmp_path), "map.zip")
+    with ZipFile(archive, "w") as z:
+        z.write(infile, "map.xml")
+    main([archive, outfile + "_zip"])
+
+    assert cmp(outfile, outfile + "_zip")
+
+
+def test_write_to_text_stream(tmp_path):
+    """Check that the model can be written to the standard output."""
+    infile = MAPS[0]
+    outfile = path.join(str(tmp_path), "model.sbml")
+    main([infile, outfile])
+    stdout = io.StringIO()
+    with patch("sys.stdin", open_file(infile)), patch("sys.stdout", stdout):
+        main(["-"])
+
+    with open(outfile, encoding="utf-8") as f:
+        assert f.read() == stdout.getvalue()
+
+
+def test_compact_bma(tmp_path):
+    """Check that compact BMA json only differs by its whitespace."""
+    infile = MAPS[0]
+    outfile = path.join(str(tmp_path), "model.bma.json")
+    compact = path.join(str(tmp_path), "compact.bma.json")
+    main([infile, outfile, "-b"])
+    main([infile, compact, "-b", "--compact"])
+
+    with open(outfile) as f, open(compact) as g:
+        model = json.load(f)
+        text = g.read()
+    assert text == json.dumps(model, separators=(",", ":"))
+
+
+def test_several_formats_at_once(tmp_path):
+    """Check that one run gives the same files as one run per format, or fails."""
+    infile = MAPS[0]
+    single = path.join(str(tmp_path), "single")
+    main([infile, single + ".sbml", "-c"])
+    main([infile, single + ".bma.json", "-b"])
+    main([infile, single + ".aeon", "-a"])
+    main([infile, path.join(str(tmp_path), "all"), "--formats", "bma,csv", "-a"])
+    main([infile, path.join(str(tmp_path), "main"), "--formats", "sbml,bma,aeon"])
+    with pytest.raises(SystemExit):
+        main([infile, single + ".bma.json", "-b", "-c"])
+
+    for ext in (".sbml", ".csv", ".bnet", ".bma.json", ".aeon"):
+        assert cmp(single + ext, path.join(str(tmp_path), "all" + ext), shallow=False)
+    for ext in (".sbml", ".bma.json", ".aeon"):
+        assert cmp(single + ext, path.join(str(tmp_path), "main" + ext), shallow=False)
+    assert not path.exists(path.join(str(tmp_path), "main.csv"))
+
+
+def test_batch_conversion(tmp_path):
+    """Check that batch conversion reports failures and skips up to date maps."""
+    broken = path.join(str(tmp_path), "broken.xml")
+    with open(broken, "w") as f:
+        f.write("<sbml")
+    outdir = path.join(str(tmp_path), "out")
+    single = path.join(str(tmp_path), "single.sbml")
+    main([MAPS[0], single])
+
+    assert main(["batch", "-j", "2", "-o", outdir, MAPS[0], broken]) == 1
+    outfile = path.join(outdir, path.basename(MAPS[0])[:-3] + "sbml")
+    assert cmp(single, outfile, shallow=False)
+    mtime = path.getmtime(outfile)
+    assert main(["batch", "-o", outdir, MAPS[0]]) == 0
+    assert path.getmtime(outfile) == mtime
+    assert main(["batch", "--formats", "sbml,csv", "-o", outdir, MAPS[0]]) == 0
+    assert path.isfile(outfile[:-4] + "bnet")
+
+
+def test_offline_validation(tmp_path):
+    """Check that our models are valid and that broken references are not."""
+    outfiles = []
+    for infile in MAPS:
+        outfiles.append(path.join(str(tmp_path), path.basename(infile)[:-3] + "sbml"))
+        main([infile, outfiles[-1]])
+    broken = path.join(str(tmp_path), "broken.sbml")
+    with open(outfiles[0]) as f, open(broken, "w") as g:
+        g.write(f.read().replace("<ci>", "<ci>unknown_", 1))
+
+    results = validate_files(outfiles + [broken], 2)
+    assert all(not results[outfile] for outfile in outfiles)
+    assert len(results[broken]) == 1
+    assert "is not an input" in validate(broken)
+
+
+def test_removed_components_are_not_in_sif(tmp_path):
+    """Check that influences of removed species are not written."""
+    infile = [m for m in MAPS if m.endswith("map4_RA_TH1.xml")][0]
+    outfile = path.join(str(tmp_path), "model.sbml")
+    main([infile, outfile, "-s", "-r", "-1"])
+
+    with open(outfile, encoding="utf-8") as f:
+        model = f.read()
+    with open(outfile[:-5] + "_raw.sif", encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("#"):
+                source, _sign, target = line.split()
+                assert f'qual:id="{source}"' in model
+                assert f'qual:id="{target}"' in model